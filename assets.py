@@ -0,0 +1,141 @@
+# Image loading with caching
+#
+# Images are loaded on first use, scaled once, converted to the display's
+# pixel format (so blits don't convert every frame) and cached by
+# (path, size). 8-bit palette images are the exception: they blit through a
+# lookup table, which measured about 3x faster than blitting their 32-bit
+# conversion, so they are kept as they are. An optional disk cache keeps the
+# scaled pixels (and palette) as raw bytes, so later starts skip PNG decoding
+# and scaling entirely. Cache entries are written to a temporary file and
+# renamed into place, and an entry that can't be read is rebuilt from the PNG.
+# Every load is timed; report() gives the breakdown.
+
+import hashlib
+import os
+import time
+
+import pygame
+
+# 256 RGB entries, stored ahead of the pixels of cached 8-bit images
+PALETTE_BYTES = 256 * 3
+
+# Bytes per pixel of each cached pixel format
+PIXEL_BYTES = {'P': 1, 'RGB': 3, 'RGBA': 4}
+
+
+class AssetManager:
+    def __init__(self, base_dir=None, disk_cache=None):
+        self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+        self.disk_cache = disk_cache
+        self.images = {}
+        self.masks = {}
+        # (path, size) -> {'source': ..., 'load_ms': ..., 'scale_ms': ..., 'convert_ms': ...}
+        self.timings = {}
+
+    def use_disk_cache(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.disk_cache = directory
+
+    def _cache_path(self, full_path, size):
+        # Keyed on the source file's mtime too, so edited images are picked up
+        stat = os.stat(full_path)
+        key = f"{full_path}:{stat.st_mtime_ns}:{size}".encode()
+        return os.path.join(self.disk_cache, hashlib.sha1(key).hexdigest()[:16])
+
+    def _load(self, path, size):
+        full_path = os.path.join(self.base_dir, path)
+        timing = {'source': 'file', 'load_ms': 0.0, 'scale_ms': 0.0, 'convert_ms': 0.0}
+        cache_path = self._cache_path(full_path, size) if self.disk_cache else None
+
+        start = time.perf_counter()
+        image = None
+        if cache_path and os.path.exists(cache_path):
+            image = self._read_cache(cache_path)
+            if image is not None:
+                timing['source'] = 'disk cache'
+        timing['load_ms'] = (time.perf_counter() - start) * 1000
+
+        if image is None:
+            start = time.perf_counter()
+            image = pygame.image.load(full_path)
+            timing['load_ms'] = (time.perf_counter() - start) * 1000
+            if size is not None and image.get_size() != size:
+                start = time.perf_counter()
+                image = pygame.transform.scale(image, size)
+                timing['scale_ms'] = (time.perf_counter() - start) * 1000
+            if cache_path:
+                self._save(cache_path, image)
+
+        # Converting needs a display mode; headless tools may not have one
+        if pygame.display.get_surface() is not None and image.get_bitsize() > 8:
+            start = time.perf_counter()
+            image = image.convert_alpha() if image.get_flags() & pygame.SRCALPHA else image.convert()
+            timing['convert_ms'] = (time.perf_counter() - start) * 1000
+
+        self.timings[(path, size)] = timing
+        return image
+
+    def _read_cache(self, cache_path):
+        # None if the entry is unreadable, truncated or malformed
+        try:
+            with open(cache_path, 'rb') as f:
+                header = f.readline().split()
+                data = f.read()
+            width, height, pixel_format = int(header[0]), int(header[1]), header[2].decode()
+            palette_bytes = PALETTE_BYTES if pixel_format == 'P' else 0
+            if len(header) != 3 or len(data) != palette_bytes + width * height * PIXEL_BYTES[pixel_format]:
+                return None
+            palette, data = data[:palette_bytes], data[palette_bytes:]
+            image = pygame.image.frombytes(data, (width, height), pixel_format)
+            if pixel_format == 'P':
+                image.set_palette([palette[i:i + 3] for i in range(0, PALETTE_BYTES, 3)])
+        except (OSError, ValueError, IndexError, KeyError, pygame.error):
+            return None
+        return image
+
+    def _save(self, cache_path, image):
+        if image.get_bitsize() == 8:
+            pixel_format = 'P'
+        else:
+            pixel_format = 'RGBA' if image.get_flags() & pygame.SRCALPHA else 'RGB'
+        # Written beside the entry and renamed over it, so a crash never leaves half an entry
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(f"{image.get_width()} {image.get_height()} {pixel_format}\n".encode())
+                if pixel_format == 'P':
+                    palette = list(image.get_palette()) + [(0, 0, 0)] * 256
+                    f.write(bytes(channel for color in palette[:256] for channel in color[:3]))
+                f.write(pygame.image.tobytes(image, pixel_format))
+            os.replace(temp_path, cache_path)
+        except OSError:
+            # The cache is only a speed-up; the image itself loaded fine
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def image(self, path, size=None):
+        key = (path, size)
+        image = self.images.get(key)
+        if image is None:
+            image = self.images[key] = self._load(path, size)
+        return image
+
+    def mask(self, path, size=None, build=pygame.mask.from_surface):
+        # Collision mask for a scaled image, built once
+        key = (path, size)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = self.masks[key] = build(self.image(path, size))
+        return mask
+
+    def report(self):
+        lines = []
+        for (path, size), t in self.timings.items():
+            total = t['load_ms'] + t['scale_ms'] + t['convert_ms']
+            lines.append(f"{path} {size}: {total:.2f} ms from {t['source']} (load {t['load_ms']:.2f}, "
+                         f"scale {t['scale_ms']:.2f}, convert {t['convert_ms']:.2f})")
+        return "\n".join(lines)
+
+
+# Shared by the games
+assets = AssetManager()
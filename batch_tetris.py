@@ -0,0 +1,227 @@
+# Vectorized Tetris: N boards advanced in lockstep with NumPy
+#
+# Same rules as TetrisEngine (spawn, gravity, level speed-up, moves, locking,
+# line clears, scoring), but every piece of state is an array with one entry
+# per board, so a step() costs a fixed number of NumPy calls whatever N is.
+# Boards hold 0 for an empty cell and 1 + index into COLORS for a block.
+
+import sys
+import time
+
+import numpy as np
+
+from tetris_engine import (COLORS, TICKS_PER_SECOND, LEVEL_TICKS,
+                           NONE, LEFT, RIGHT, DOWN, ROTATE, TetrisEngine)
+from tetris_shapes import SHAPE_TABLE
+
+ROWS = 20
+COLS = 10
+SPAWN_X = 5
+SPAWN_Y = 0
+
+# CELLS[shape, rotation] -> (4, 2) array of (dx, dy); rotations are padded to
+# four by cycling, so (rotation % NUM_ROTATIONS[shape]) indexes it directly
+NUM_ROTATIONS = np.array([len(shape.rotations) for shape in SHAPE_TABLE], dtype=np.int64)
+CELLS = np.array([[shape.rotations[r % len(shape.rotations)].cells for r in range(4)]
+                  for shape in SHAPE_TABLE], dtype=np.int64)
+
+_MULT = np.uint64(0x2545F4914F6CDD1D)
+
+
+def _splitmix64(seeds):
+    z = seeds.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    # xorshift must never start from zero
+    return np.where(z == 0, np.uint64(1), z)
+
+
+class BatchTetris:
+    def __init__(self, n, seeds=None):
+        self.n = n
+        if seeds is None:
+            seeds = np.arange(n)
+        self.seeds = np.asarray(seeds, dtype=np.uint64)
+        self.rng_state = _splitmix64(self.seeds)
+        self.boards = np.zeros((n, ROWS, COLS), dtype=np.uint8)
+        # Flat view of the same memory for single-gather collision tests
+        self._cells = self.boards.reshape(-1)
+        self.shape = np.zeros(n, dtype=np.int64)
+        self.color = np.zeros(n, dtype=np.uint8)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.next_shape = np.zeros(n, dtype=np.int64)
+        self.next_color = np.zeros(n, dtype=np.uint8)
+        self.tick = np.zeros(n, dtype=np.int64)
+        self.fall_ticks = np.zeros(n, dtype=np.int64)
+        self.level_ticks = np.zeros(n, dtype=np.int64)
+        self.fall_speed = np.zeros(n, dtype=np.float64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines = np.zeros(n, dtype=np.int64)
+        self.pieces = np.zeros(n, dtype=np.int64)
+        self.lost = np.zeros(n, dtype=bool)
+        self.reset()
+
+    # Per-board xorshift64* streams, advanced together
+    def _random(self, idx, k):
+        x = self.rng_state[idx]
+        x ^= x >> np.uint64(12)
+        x ^= x << np.uint64(25)
+        x ^= x >> np.uint64(27)
+        self.rng_state[idx] = x
+        return ((x * _MULT) >> np.uint64(33)) % np.uint64(k)
+
+    def _spawn(self, idx):
+        self.shape[idx] = self.next_shape[idx]
+        self.color[idx] = self.next_color[idx]
+        self.rotation[idx] = 0
+        self.x[idx] = SPAWN_X
+        self.y[idx] = SPAWN_Y
+        self.next_shape[idx] = self._random(idx, len(SHAPE_TABLE))
+        self.next_color[idx] = self._random(idx, len(COLORS)) + 1
+
+    def reset(self, mask=None):
+        idx = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        if idx.size == 0:
+            return
+        self.boards[idx] = 0
+        self.tick[idx] = 0
+        self.fall_ticks[idx] = 0
+        self.level_ticks[idx] = 0
+        self.fall_speed[idx] = 0.5
+        self.score[idx] = 0
+        self.lines[idx] = 0
+        self.pieces[idx] = 0
+        self.lost[idx] = False
+        # Draw current then next, like TetrisEngine.__init__
+        self.next_shape[idx] = self._random(idx, len(SHAPE_TABLE))
+        self.next_color[idx] = self._random(idx, len(COLORS)) + 1
+        self._spawn(idx)
+
+    def collides(self, idx, shape, rotation, x, y):
+        cells = CELLS[shape, rotation % NUM_ROTATIONS[shape]]
+        cx = x[:, None] + cells[:, :, 0]
+        cy = y[:, None] + cells[:, :, 1]
+        outside = (cx < 0) | (cx >= COLS) | (cy >= ROWS)
+        # Rows above the board are open but still walled
+        inside = ~outside & (cy >= 0)
+        flat = np.where(inside, idx[:, None] * (ROWS * COLS) + cy * COLS + cx, 0)
+        occupied = (self._cells.take(flat) != 0) & inside
+        return (outside | occupied).any(axis=1)
+
+    def step(self, actions=NONE):
+        # Advance every live board one tick; returns rows cleared per board
+        actions = np.broadcast_to(np.asarray(actions, dtype=np.int64), (self.n,))
+        cleared = np.zeros(self.n, dtype=np.int64)
+        alive = ~self.lost
+        if not alive.any():
+            return cleared
+
+        self.tick += alive
+        self.fall_ticks += alive
+        self.level_ticks += alive
+
+        # Increase speed every 60 seconds
+        level_up = np.flatnonzero(alive & (self.level_ticks > LEVEL_TICKS))
+        if level_up.size:
+            self.level_ticks[level_up] = 0
+            faster = level_up[self.fall_speed[level_up] > 0.1]
+            self.fall_speed[faster] -= 0.005
+
+        # Piece falls
+        change_piece = np.zeros(self.n, dtype=bool)
+        falling = np.flatnonzero(alive & (self.fall_ticks > self.fall_speed * TICKS_PER_SECOND))
+        if falling.size:
+            self.fall_ticks[falling] = 0
+            new_y = self.y[falling] + 1
+            blocked = self.collides(falling, self.shape[falling], self.rotation[falling], self.x[falling], new_y)
+            landed = blocked & (new_y > 0)
+            self.y[falling[~landed]] = new_y[~landed]
+            change_piece[falling[landed]] = True
+
+        # Player input
+        moving = np.flatnonzero(alive & (actions != NONE))
+        if moving.size:
+            act = actions[moving]
+            x = self.x[moving] + (act == RIGHT) - (act == LEFT)
+            y = self.y[moving] + (act == DOWN)
+            rotation = self.rotation[moving] + (act == ROTATE)
+            ok = ~self.collides(moving, self.shape[moving], rotation, x, y)
+            accepted = moving[ok]
+            self.x[accepted] = x[ok]
+            self.y[accepted] = y[ok]
+            self.rotation[accepted] = rotation[ok]
+
+        locking = np.flatnonzero(change_piece)
+        if locking.size:
+            cleared[locking] = self._lock(locking)
+        return cleared
+
+    def _lock(self, idx):
+        shape = self.shape[idx]
+        cells = CELLS[shape, self.rotation[idx] % NUM_ROTATIONS[shape]]
+        cx = self.x[idx, None] + cells[:, :, 0]
+        cy = self.y[idx, None] + cells[:, :, 1]
+        board_idx = np.broadcast_to(idx[:, None], cx.shape)
+        colors = np.broadcast_to(self.color[idx, None], cx.shape)
+        visible = (cy >= 0) & (cy < ROWS)
+        self.boards[board_idx[visible], cy[visible], cx[visible]] = colors[visible]
+        self.pieces[idx] += 1
+        self._spawn(idx)
+
+        # Line clears: stable-sort full rows to the top, then blank them
+        boards = self.boards[idx]
+        full = (boards != 0).all(axis=2)
+        count = full.sum(axis=1)
+        rows = np.flatnonzero(count)
+        if rows.size:
+            order = np.argsort(~full[rows], axis=1, kind='stable')
+            compacted = np.take_along_axis(boards[rows], order[:, :, None], axis=1)
+            compacted[np.arange(ROWS)[None, :] < count[rows, None]] = 0
+            self.boards[idx[rows]] = compacted
+
+        # Cells that locked above the board drop onto it with the rest
+        landed = (cy < 0) & (cy + count[:, None] >= 0)
+        if landed.any():
+            self.boards[board_idx[landed], (cy + count[:, None])[landed], cx[landed]] = colors[landed]
+
+        # Game over is judged after the clear, as in TetrisEngine: cells in
+        # cleared rows are gone and the rest drop by the cleared rows below
+        row = np.clip(cy, 0, ROWS - 1)
+        below = count[:, None] - np.cumsum(full, axis=1)
+        shown = cy >= 0
+        drop = np.where(shown, np.take_along_axis(below, row, axis=1), count[:, None])
+        gone = shown & np.take_along_axis(full, row, axis=1)
+        self.lost[idx] = ((cy + drop < 1) & ~gone).any(axis=1)
+        self.lines[idx] += count
+        self.score[idx] += count * 10
+        return count
+
+
+def benchmark(n=1024, steps=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    batch = BatchTetris(n)
+    start = time.perf_counter()
+    for _ in range(steps):
+        batch.step(rng.integers(0, 5, n))
+        batch.reset(batch.lost)
+    batch_rate = n * steps / (time.perf_counter() - start)
+
+    engine = TetrisEngine(seed)
+    actions = rng.integers(0, 5, steps).tolist()
+    start = time.perf_counter()
+    for action in actions:
+        engine.step(action)
+        if engine.lost:
+            engine = TetrisEngine(seed)
+    single_rate = steps / (time.perf_counter() - start)
+    return batch_rate, single_rate
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    batch_rate, single_rate = benchmark(n)
+    print(f'batch of {n}: {batch_rate:.0f} board-steps/s, '
+          f'single engine: {single_rate:.0f} steps/s ({batch_rate / single_rate:.1f}x)')
@@ -0,0 +1,118 @@
+# Structure-of-arrays storage for bouncing sprites
+#
+# Every entity in a store shares one image. Positions and velocities live in
+# contiguous NumPy arrays, so moving, bouncing and testing thousands of
+# entities against a rect is a handful of array operations per frame, and
+# drawing is a single Surface.blits call. Movement keeps the move-then-bounce
+# rule the old per-sprite update() used. Positions are floats so a physics
+# step can be a fraction of a 60 Hz frame; the previous positions are kept so
+# a frame drawn between two steps can be interpolated.
+#
+# Collision is two-phase: the vectorized rect test picks the candidates and
+# only those get a pixel mask test, with the mask computed once per image.
+#
+# A store is also its own pool: clear() keeps the arrays for the next round,
+# and max_count caps how far they may grow. Once full, a spawn overwrites the
+# oldest live entity instead of allocating.
+
+from itertools import repeat
+
+import numpy as np
+import pygame
+
+
+# Array bytes per entity: float64 x, y, vx, vy and previous x, y
+ENTITY_BYTES = 48
+
+ARRAYS = ('pos', 'vel', 'prev')
+
+
+class EntityStore:
+    __slots__ = ('image', 'mask', 'size', 'bounds', 'max_count', 'count', 'pos', 'vel', 'prev', 'oldest', 'culled',
+                 'narrow_checks')
+
+    def __init__(self, image, bounds, capacity=64, max_count=None, mask=None):
+        self.image = image
+        self.mask = mask or pygame.mask.from_surface(image)
+        self.size = np.array(image.get_size(), np.int32)
+        self.bounds = np.array(bounds, np.int32)
+        self.max_count = max_count
+        capacity = min(capacity, max_count) if max_count else capacity
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.prev = np.zeros((capacity, 2))
+        # Next slot to overwrite once the store is at max_count
+        self.oldest = 0
+        self.culled = 0
+        # Mask tests run so far; callers diff it to get a per-frame count
+        self.narrow_checks = 0
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        capacity = len(self.pos) * 2
+        if self.max_count:
+            capacity = min(capacity, self.max_count)
+        for name in ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((capacity, 2))
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def spawn(self, x, y, vx, vy):
+        if self.count == self.max_count:
+            # Full: cull the oldest entity and reuse its slot
+            slot = self.oldest
+            self.oldest = (slot + 1) % self.count
+            self.culled += 1
+        else:
+            if self.count == len(self.pos):
+                self._grow()
+            slot = self.count
+            self.count += 1
+        self.pos[slot] = (x, y)
+        self.prev[slot] = (x, y)
+        self.vel[slot] = (vx, vy)
+
+    def clear(self):
+        # Forget every entity but keep the arrays for reuse
+        self.count = 0
+        self.oldest = 0
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def update(self, scale=1.0):
+        # One physics step; `scale` is the step length in 60 Hz frames
+        pos = self.pos[:self.count]
+        vel = self.vel[:self.count]
+        self.prev[:self.count] = pos
+        pos += vel * scale
+        # Bounce off walls, each axis on its own
+        vel[(pos <= 0) | (pos + self.size >= self.bounds)] *= -1
+
+    def overlapping(self, rect):
+        # Boolean mask of entities whose rect overlaps `rect` (same test as Rect.colliderect)
+        pos = self.pos[:self.count]
+        x = pos[:, 0]
+        y = pos[:, 1]
+        width, height = self.size
+        return (x < rect.right) & (x + width > rect.left) & (y < rect.bottom) & (y + height > rect.top)
+
+    def collide_mask(self, rect, mask):
+        # True if any entity's mask overlaps `mask` placed at `rect`
+        for x, y in self.pos[:self.count][self.overlapping(rect)].tolist():
+            self.narrow_checks += 1
+            if mask.overlap(self.mask, (round(x) - rect.x, round(y) - rect.y)):
+                return True
+        return False
+
+    def draw(self, surface, alpha=1.0):
+        # `alpha` is how far the frame is from the previous step to the current one
+        pos = self.pos[:self.count]
+        if alpha < 1.0:
+            prev = self.prev[:self.count]
+            pos = prev + (pos - prev) * alpha
+        surface.blits(zip(repeat(self.image), np.rint(pos).astype(np.int32).tolist()), False)
@@ -0,0 +1,127 @@
+# Frame pacing for the game loops
+#
+# FrameScheduler runs game logic on a fixed timestep, caps how often a frame
+# is drawn, and sleeps in pygame.event.wait until the next update is due (or
+# input arrives) instead of spinning. It also keeps a frame-time budget: how
+# long each frame spent doing real work versus the time it was allowed.
+#
+# Because logic and drawing are decoupled, a frame usually falls between two
+# logic steps; alpha() says how far, so positions can be interpolated.
+
+import argparse
+import time
+
+import pygame
+
+
+class FrameScheduler:
+    def __init__(self, update_hz=60, max_fps=60, max_updates=5):
+        self.step = 1.0 / update_hz
+        self.frame_interval = 1.0 / max_fps if max_fps else 0.0
+        self.max_updates = max_updates  # Catch-up cap after a stall
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+        self.last_render = 0.0
+        self.render_pending = True
+
+        # Budget bookkeeping
+        self.started = self.last_time
+        self.work_start = self.last_time
+        self.frames = 0
+        self.updates_run = 0
+        self.dropped = 0
+        self.work_total = 0.0
+        self.work_max = 0.0
+
+    def _timeout(self):
+        # Seconds until something is due: the next update or a pending render
+        now = time.perf_counter()
+        timeout = self.step - (self.accumulator + now - self.last_time)
+        if self.render_pending:
+            timeout = min(timeout, self.last_render + self.frame_interval - now)
+        return timeout
+
+    def poll(self):
+        # Sleep until input arrives or the next deadline, then return all pending events
+        timeout = self._timeout()
+        events = []
+        if timeout > 0.001:
+            event = pygame.event.wait(int(timeout * 1000))
+            if event.type != pygame.NOEVENT:
+                events.append(event)
+        events.extend(pygame.event.get())
+        self.work_start = time.perf_counter()
+        return events
+
+    def updates(self):
+        # Number of fixed logic steps to run this frame
+        now = time.perf_counter()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        count = int(self.accumulator / self.step)
+        if count > self.max_updates:
+            # Drop the backlog rather than spiral after a long stall
+            self.dropped += count - self.max_updates
+            count = self.max_updates
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= count * self.step
+        self.updates_run += count
+        return count
+
+    def alpha(self):
+        # Fraction of a step since the last update, for interpolated drawing
+        return min(self.accumulator / self.step, 1.0)
+
+    def request_render(self):
+        self.render_pending = True
+
+    def should_render(self):
+        return self.render_pending and time.perf_counter() - self.last_render >= self.frame_interval
+
+    def rendered(self):
+        now = time.perf_counter()
+        self.last_render = now
+        self.render_pending = False
+        self.frames += 1
+        work = now - self.work_start
+        self.work_total += work
+        self.work_max = max(self.work_max, work)
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        frames = max(self.frames, 1)
+        budget = self.frame_interval or self.step
+        average = self.work_total / frames
+        return {
+            'fps': self.frames / elapsed,
+            'updates_per_second': self.updates_run / elapsed,
+            'dropped_updates': self.dropped,
+            'work_avg_ms': average * 1000,
+            'work_max_ms': self.work_max * 1000,
+            'budget_ms': budget * 1000,
+            'budget_used': average / budget,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (f"{s['fps']:.1f} fps, {s['updates_per_second']:.1f} updates/s, "
+                f"frame work avg {s['work_avg_ms']:.2f} ms / max {s['work_max_ms']:.2f} ms "
+                f"of {s['budget_ms']:.2f} ms budget ({s['budget_used']:.0%}), "
+                f"{s['dropped_updates']} updates dropped")
+
+
+def _rate(text):
+    # Both rates are divided into a period, so zero or less makes no sense
+    try:
+        rate = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate: {text!r}")
+    if rate < 1:
+        raise argparse.ArgumentTypeError(f"rate must be a positive number, not {rate}")
+    return rate
+
+def add_timing_arguments(parser, default_hz=60):
+    parser.add_argument('--physics-hz', type=_rate, default=default_hz,
+                        help='fixed simulation rate in steps per second')
+    parser.add_argument('--fps', type=_rate, default=default_hz, help='draw at most this many frames per second')
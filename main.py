@@ -1,218 +1,370 @@
+import argparse
 import pygame
 import random
-import sys
+import time
 
-# Initialize Pygame
-pygame.init()
+from replay import Recorder, add_arguments, new_seed
+from assets import assets
+from entity_store import ENTITY_BYTES, EntityStore
+from frame_pacing import add_timing_arguments
+from scenes import Scene, SceneManager
+from startup import add_startup_arguments, startup
+from text_cache import get_font, render_text
+
+# Initialize only the pygame subsystems the game uses
+startup.init()
 
 # Screen dimensions
 screen_width = 640
 screen_height = 480
-screen = pygame.display.set_mode((screen_width, screen_height))
-pygame.display.set_caption("Squirrel Finder")
+with startup.phase('display'):
+    screen = pygame.display.set_mode((screen_width, screen_height))
+    pygame.display.set_caption("Squirrel Finder")
 
 # Clock to control frame rate
 clock = pygame.time.Clock()
+FPS = 60
+
+# Speeds and timings are in 60 Hz frames; physics can step at another rate
+# (--physics-hz) and scales them to its step length
+STRAWBERRY_FRAMES = FPS  # Strawberry every second
+SQUIRREL_FRAMES = 3 * FPS  # Squirrel after 3 seconds
+
+# Hazard speeds in pixels per frame, per axis
+STRAWBERRY_SPEEDS = [-4, -3, -2, 2, 3, 4]
+SQUIRREL_SPEEDS = [-5, -4, -3, 3, 4, 5]
+
+# Memory for strawberry arrays; past this the oldest strawberry is culled per spawn.
+# 3 MiB holds 64Ki strawberries at ENTITY_BYTES each
+HAZARD_BUDGET = 3 * 1024 * 1024
+
+# Held arrow keys are packed into one input word per frame; this is what gets recorded
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
 
 # Colors
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
-# Font for text
-font = pygame.font.SysFont('Arial', 20)
+# Font for text, opened on first use
+def font():
+    return get_font('Arial', 20)
+
+# Images are scaled to 40x40 pixels; the asset cache loads them on first use
+SPRITE_SIZE = (40, 40)
+KOALA_IMAGE = 'koala.png'
+STRAWBERRY_IMAGE = 'strawberry.png'
+SQUIRREL_IMAGE = 'squirrel.png'
+
+# The PNGs have a white/grey checkerboard baked in instead of transparency, so
+# a collision mask is every pixel that is not near-white
+BACKGROUND_THRESHOLD = (30, 30, 30, 255)
+
+def sprite_mask(image):
+    # from_threshold needs a true-colour surface; the PNGs load as 8-bit
+    surface = pygame.Surface(image.get_size(), 0, 32)
+    surface.blit(image, (0, 0))
+    mask = pygame.mask.from_threshold(surface, WHITE, BACKGROUND_THRESHOLD)
+    mask.invert()
+    return mask
 
-# Load images and scale them to 40x40 pixels
-koala_img = pygame.image.load('koala.png')
-koala_img = pygame.transform.scale(koala_img, (40, 40))
-strawberry_img = pygame.image.load('strawberry.png')
-strawberry_img = pygame.transform.scale(strawberry_img, (40, 40))
-squirrel_img = pygame.image.load('squirrel.png')
-squirrel_img = pygame.transform.scale(squirrel_img, (40, 40))
+def sprite(path):
+    # Display-format image and its collision mask, both built once
+    return assets.image(path, SPRITE_SIZE), assets.mask(path, SPRITE_SIZE, sprite_mask)
 
 # Player class
 class Player(pygame.sprite.Sprite):
     def __init__(self):
         super().__init__()
-        self.image = koala_img
+        self.image, self.mask = sprite(KOALA_IMAGE)
         self.rect = self.image.get_rect()
-        self.rect.center = (screen_width // 2, screen_height // 2)
         self.speed = 7
+        self.reset()
 
-    def update(self, keys_pressed):
-        if keys_pressed[pygame.K_LEFT]:
-            self.rect.x -= self.speed
-        if keys_pressed[pygame.K_RIGHT]:
-            self.rect.x += self.speed
-        if keys_pressed[pygame.K_UP]:
-            self.rect.y -= self.speed
-        if keys_pressed[pygame.K_DOWN]:
-            self.rect.y += self.speed
+    def reset(self):
+        self.rect.center = (screen_width // 2, screen_height // 2)
+        # Float position for sub-frame steps; rect is its rounded copy, used for collision
+        self.x, self.y = self.rect.topleft
+        self.prev_x, self.prev_y = self.x, self.y
+
+    def update(self, keys, scale=1.0):
+        self.prev_x, self.prev_y = self.x, self.y
+        step = self.speed * scale
+        if keys & INPUT_LEFT:
+            self.x -= step
+        if keys & INPUT_RIGHT:
+            self.x += step
+        if keys & INPUT_UP:
+            self.y -= step
+        if keys & INPUT_DOWN:
+            self.y += step
 
         # Keep player on the screen
-        self.rect.clamp_ip(screen.get_rect())
-
-# Strawberry class
-class Strawberry(pygame.sprite.Sprite):
-    def __init__(self):
-        super().__init__()
-        self.image = strawberry_img
-        self.rect = self.image.get_rect()
-        self.rect.x = random.randint(0, screen_width - 40)
-        self.rect.y = random.randint(0, screen_height - 40)
-        self.vx = random.choice([-4, -3, -2, 2, 3, 4])
-        self.vy = random.choice([-4, -3, -2, 2, 3, 4])
-
-    def update(self):
-        self.rect.x += self.vx
-        self.rect.y += self.vy
+        self.x = min(max(self.x, 0), screen_width - self.rect.width)
+        self.y = min(max(self.y, 0), screen_height - self.rect.height)
+        self.rect.topleft = (round(self.x), round(self.y))
+
+    def draw_position(self, alpha=1.0):
+        return (round(self.prev_x + (self.x - self.prev_x) * alpha),
+                round(self.prev_y + (self.y - self.prev_y) * alpha))
+
+def read_input():
+    keys_pressed = pygame.key.get_pressed()
+    keys = 0
+    if keys_pressed[pygame.K_LEFT]:
+        keys |= INPUT_LEFT
+    if keys_pressed[pygame.K_RIGHT]:
+        keys |= INPUT_RIGHT
+    if keys_pressed[pygame.K_UP]:
+        keys |= INPUT_UP
+    if keys_pressed[pygame.K_DOWN]:
+        keys |= INPUT_DOWN
+    return keys
+
+def make_hazards(budget=HAZARD_BUDGET):
+    # Strawberry and squirrel stores for a whole session; every round reuses them
+    bounds = (screen_width, screen_height)
+    strawberry_img, strawberry_mask = sprite(STRAWBERRY_IMAGE)
+    squirrel_img, squirrel_mask = sprite(SQUIRREL_IMAGE)
+    return (EntityStore(strawberry_img, bounds, max_count=max(1, budget // ENTITY_BYTES), mask=strawberry_mask),
+            EntityStore(squirrel_img, bounds, max_count=1, mask=squirrel_mask))
+
+# One round, advanced a step at a time; all timing is in steps so it replays exactly
+class Round:
+    def __init__(self, player, rng, hazards, stress=0, hz=FPS):
+        self.player = player
+        self.rng = rng
+        self.hz = hz
+        # Step length in 60 Hz frames, and the spawn timers in steps
+        self.scale = FPS / hz
+        self.strawberry_steps = STRAWBERRY_FRAMES * hz // FPS
+        self.squirrel_steps = SQUIRREL_FRAMES * hz // FPS
+        # Hazards are moved, tested and drawn as whole arrays, not sprite by sprite
+        self.strawberries, self.squirrels = hazards
+        self.strawberries.clear()
+        self.squirrels.clear()
+        self.frame = 0
+        self.strawberry_timer = 0
+        self.squirrel_spawned = False
+
+        # Stress mode: start with this many strawberries; hits are counted, not fatal
+        self.stress = stress
+        self.hits = 0
+        # Pixel-mask tests in the last frame and over the whole round
+        self.narrow_checks = 0
+        self.narrow_total = 0
+        for _ in range(stress):
+            self.spawn(self.strawberries, STRAWBERRY_SPEEDS)
 
-        # Bounce off walls
-        if self.rect.left <= 0 or self.rect.right >= screen_width:
-            self.vx = -self.vx
-        if self.rect.top <= 0 or self.rect.bottom >= screen_height:
-            self.vy = -self.vy
-
-# Squirrel class
-class Squirrel(pygame.sprite.Sprite):
-    def __init__(self):
-        super().__init__()
-        self.image = squirrel_img
-        self.rect = self.image.get_rect()
-        self.rect.x = random.randint(0, screen_width - 40)
-        self.rect.y = random.randint(0, screen_height - 40)
-        self.vx = random.choice([-5, -4, -3, 3, 4, 5])
-        self.vy = random.choice([-5, -4, -3, 3, 4, 5])
+        # Reset player position
+        player.reset()
+
+    def spawn(self, store, speeds):
+        # Random position and velocity, drawn from the round's RNG in a fixed order
+        x = self.rng.randint(0, screen_width - 40)
+        y = self.rng.randint(0, screen_height - 40)
+        store.spawn(x, y, self.rng.choice(speeds), self.rng.choice(speeds))
+
+    def step(self, keys):
+        # Returns the end-of-round message, or None while the round goes on
+        self.frame += 1
+        self.player.update(keys, self.scale)
+
+        # Spawn strawberry every second
+        if self.frame - self.strawberry_timer >= self.strawberry_steps:
+            self.spawn(self.strawberries, STRAWBERRY_SPEEDS)
+            self.strawberry_timer = self.frame
+
+        # Spawn squirrel after 3 seconds
+        if not self.squirrel_spawned and self.frame >= self.squirrel_steps:
+            self.spawn(self.squirrels, SQUIRREL_SPEEDS)
+            self.squirrel_spawned = True
+
+        # Move hazards
+        self.strawberries.update(self.scale)
+        self.squirrels.update(self.scale)
+
+        # Collision detection: rect test on everything, mask test only where rects overlap
+        player = self.player
+        checks = self.strawberries.narrow_checks + self.squirrels.narrow_checks
+        message = None
+        if self.strawberries.collide_mask(player.rect, player.mask):
+            if not self.stress:
+                message = "You Died!"
+            self.hits += 1
+        if not message and self.squirrels.collide_mask(player.rect, player.mask):
+            message = "You Win!"
+        self.narrow_checks = self.strawberries.narrow_checks + self.squirrels.narrow_checks - checks
+        self.narrow_total += self.narrow_checks
+        return message
+
+    def draw(self, surface, alpha=1.0):
+        surface.fill(BLACK)
+        surface.blit(self.player.image, self.player.draw_position(alpha))
+        self.strawberries.draw(surface, alpha)
+        self.squirrels.draw(surface, alpha)
+
+        # Draw "openai" text
+        openai_text = render_text(font(), "openai", WHITE)
+        surface.blit(openai_text, (10, screen_height - 30))
+
+        # Draw timer
+        elapsed_time = self.frame / self.hz
+        timer_text = render_text(font(), f"Time: {elapsed_time:.1f}", WHITE)
+        surface.blit(timer_text, (screen_width - 120, 10))
+
+        if self.stress:
+            stress_text = render_text(font(), f"{len(self.strawberries)} strawberries, {self.hits} hits, "
+                                      f"{self.narrow_checks} mask tests", WHITE)
+            surface.blit(stress_text, (10, 10))
+
+# Everything that lasts across rounds
+class Session:
+    def __init__(self, seed=None, recorder=None, stress=0, budget=HAZARD_BUDGET, hz=FPS):
+        self.rng = random.Random(seed)
+        self.hz = hz
+        self.player = Player()
+        self.hazards = make_hazards(budget)
+        self.recorder = recorder
+        self.stress = stress
+
+class InstructionsScene(Scene):
+    def __init__(self, session):
+        self.session = session
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            return PlayScene(self.session)
+        return None
+
+    def draw(self, surface):
+        surface.fill(BLACK)
+        instructions = [
+            "Squirrel Finder",
+            "",
+            "Instructions:",
+            "- You are the koala.",
+            "- Use the arrow keys to move.",
+            "- Avoid the strawberries.",
+            "- Touch the squirrel to win.",
+            "- Strawberries spawn every second.",
+            "- Squirrel spawns after 3 seconds.",
+            "- Game will restart automatically.",
+            "",
+            "Press any key to start."
+        ]
+
+        for i, line in enumerate(instructions):
+            text = render_text(font(), line, WHITE)
+            surface.blit(text, (50, 30 + i * 30))
+
+class PlayScene(Scene):
+    idle = False
+
+    def __init__(self, session):
+        self.session = session
+        self.game = Round(session.player, session.rng, session.hazards, session.stress, session.hz)
+        self.work = 0.0
 
     def update(self):
-        self.rect.x += self.vx
-        self.rect.y += self.vy
-
-        # Bounce off walls
-        if self.rect.left <= 0 or self.rect.right >= screen_width:
-            self.vx = -self.vx
-        if self.rect.top <= 0 or self.rect.bottom >= screen_height:
-            self.vy = -self.vy
-
-# Function to display instructions
-def show_instructions():
-    screen.fill(BLACK)
-    instructions = [
-        "Squirrel Finder",
-        "",
-        "Instructions:",
-        "- You are the koala.",
-        "- Use the arrow keys to move.",
-        "- Avoid the strawberries.",
-        "- Touch the squirrel to win.",
-        "- Strawberries spawn every second.",
-        "- Squirrel spawns after 3 seconds.",
-        "- Game will restart automatically.",
-        "",
-        "Press any key to start."
-    ]
-
-    for i, line in enumerate(instructions):
-        text = font.render(line, True, WHITE)
-        screen.blit(text, (50, 30 + i * 30))
-
-    pygame.display.flip()
-
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                waiting = False
-
-# Function to display game over screen
-def show_game_over(message):
-    screen.fill(BLACK)
-    text = font.render(message, True, WHITE)
-    screen.blit(text, (screen_width // 2 - text.get_width() // 2, screen_height // 2 - 20))
-    subtext = font.render("Restarting...", True, WHITE)
-    screen.blit(subtext, (screen_width // 2 - subtext.get_width() // 2, screen_height // 2 + 20))
-    pygame.display.flip()
-    pygame.time.delay(2000)
+        start = time.perf_counter()
+        keys = read_input()
+        if self.session.recorder:
+            self.session.recorder.record(keys)
+        game = self.game
+        message = game.step(keys)
+        self.work += time.perf_counter() - start
+        if not message:
+            return None
+        if self.session.stress:
+            print(f"{len(game.strawberries)} strawberries ({game.strawberries.culled} culled, "
+                  f"{game.strawberries.nbytes() // 1024} KiB): {game.frame} steps, "
+                  f"{self.work / game.frame * 1000:.2f} ms per step, "
+                  f"{game.narrow_total / game.frame:.1f} mask tests per step")
+        return GameOverScene(self.session, message)
+
+    def draw(self, surface, alpha=1.0):
+        start = time.perf_counter()
+        self.game.draw(surface, alpha)
+        self.work += time.perf_counter() - start
+
+class GameOverScene(Scene):
+    # Shown for two seconds, then back to the instructions; the window stays responsive
+    duration = 2.0
+
+    def __init__(self, session, message):
+        self.session = session
+        self.message = message
+
+    def timeout(self):
+        return InstructionsScene(self.session)
+
+    def draw(self, surface):
+        surface.fill(BLACK)
+        text = render_text(font(), self.message, WHITE)
+        surface.blit(text, (screen_width // 2 - text.get_width() // 2, screen_height // 2 - 20))
+        subtext = render_text(font(), "Restarting...", WHITE)
+        surface.blit(subtext, (screen_width // 2 - subtext.get_width() // 2, screen_height // 2 + 20))
 
 # Main game loop
-def main():
+def main(seed=None, recorder=None, stress=0, budget=HAZARD_BUDGET, hz=FPS, max_fps=FPS):
+    session = Session(seed, recorder, stress, budget, hz)
+    SceneManager(screen, hz, max_fps).run(InstructionsScene(session))
+    pygame.quit()
+
+def play_replay(replay, speed=0):
+    # Re-run a recorded session round by round; headless at full speed when speed is 0
+    rng = random.Random(replay.seed)
     player = Player()
-    player_group = pygame.sprite.Group(player)
-    strawberry_group = pygame.sprite.Group()
-    squirrel_group = pygame.sprite.Group()
-
+    hazards = make_hazards()
+    inputs = replay.inputs()
+    results = []
     while True:
-        show_instructions()
-
-        # Game variables
-        start_ticks = pygame.time.get_ticks()
-        strawberry_timer = pygame.time.get_ticks()
-        squirrel_spawned = False
-        running = True
-
-        # Reset player position
-        player.rect.center = (screen_width // 2, screen_height // 2)
-
-        # Clear groups
-        strawberry_group.empty()
-        squirrel_group.empty()
-
-        while running:
-            dt = clock.tick(60)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-            keys_pressed = pygame.key.get_pressed()
-            player.update(keys_pressed)
-
-            # Spawn strawberry every second
-            if pygame.time.get_ticks() - strawberry_timer > 1000:
-                strawberry = Strawberry()
-                strawberry_group.add(strawberry)
-                strawberry_timer = pygame.time.get_ticks()
-
-            # Spawn squirrel after 3 seconds
-            if not squirrel_spawned and pygame.time.get_ticks() - start_ticks > 3000:
-                squirrel = Squirrel()
-                squirrel_group.add(squirrel)
-                squirrel_spawned = True
-
-            # Update sprites
-            strawberry_group.update()
-            squirrel_group.update()
-
-            # Collision detection
-            if pygame.sprite.spritecollideany(player, strawberry_group):
-                show_game_over("You Died!")
-                running = False
-                break
-
-            if pygame.sprite.spritecollideany(player, squirrel_group):
-                show_game_over("You Win!")
-                running = False
+        game = Round(player, rng, hazards)
+        message = None
+        for keys in inputs:
+            message = game.step(keys)
+            if speed:
+                pygame.event.pump()
+                game.draw(screen)
+                pygame.display.flip()
+                clock.tick(FPS * speed)
+            if message:
                 break
-
-            # Drawing
-            screen.fill(BLACK)
-            player_group.draw(screen)
-            strawberry_group.draw(screen)
-            squirrel_group.draw(screen)
-
-            # Draw "openai" text
-            openai_text = font.render("openai", True, WHITE)
-            screen.blit(openai_text, (10, screen_height - 30))
-
-            # Draw timer
-            elapsed_time = (pygame.time.get_ticks() - start_ticks) / 1000
-            timer_text = font.render(f"Time: {elapsed_time:.1f}", True, WHITE)
-            screen.blit(timer_text, (screen_width - 120, 10))
-
-            pygame.display.flip()
+        if message is None:
+            break
+        results.append((message, game.frame))
+    return results
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Squirrel Finder")
+    parser.add_argument("--stress", type=int, default=0, metavar="N",
+                        help="start every round with N strawberries that count hits instead of killing")
+    parser.add_argument("--hazard-budget", type=int, default=HAZARD_BUDGET // 1024, metavar="KIB",
+                        help="memory cap for strawberries; the oldest are culled beyond it")
+    parser.add_argument("--asset-cache", metavar="DIR", help="keep scaled images in DIR for faster starts")
+    parser.add_argument("--asset-timings", action="store_true", help="print image load timings on exit")
+    add_timing_arguments(parser, FPS)
+    add_startup_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    startup.verbose = args.startup_timings
+    if args.stress and args.record:
+        parser.error("--record is not supported with --stress")
+    if args.physics_hz != FPS and args.record:
+        parser.error(f"recordings are made at the default {FPS} Hz physics rate")
+    if args.hazard_budget * 1024 != HAZARD_BUDGET and args.record:
+        parser.error(f"recordings are made with the default {HAZARD_BUDGET // 1024} KiB hazard budget")
+    if args.asset_cache:
+        assets.use_disk_cache(args.asset_cache)
+    seed = args.seed if args.seed is not None else new_seed()
+    recorder = Recorder("squirrel-finder", seed) if args.record else None
+    try:
+        main(seed, recorder, args.stress, args.hazard_budget * 1024, args.physics_hz, args.fps)
+    finally:
+        if recorder:
+            recorder.save(args.record)
+        if args.asset_timings:
+            print(assets.report())
@@ -1,9 +1,21 @@
+import argparse
+import os
 import pygame
-import sys
 import random
+from collections import namedtuple
+from itertools import repeat
 
-# Initialize Pygame
-pygame.init()
+import numpy as np
+
+from frame_pacing import add_timing_arguments
+from particles import ParticlePool
+from replay import Recorder, add_arguments, new_seed
+from scenes import EXIT, REDRAW_EVENTS, Scene, SceneManager
+from startup import add_startup_arguments, startup
+from text_cache import get_font, render_text
+
+# Initialize only the pygame subsystems the game uses
+startup.init()
 
 # Screen dimensions
 SCREEN_WIDTH = 800
@@ -12,30 +24,50 @@ SCREEN_HEIGHT = 600
 # Colors (RGB)
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
-RED = (255, 100, 100)
-GREEN = (100, 255, 100)
-BLUE = (100, 100, 255)
-YELLOW = (255, 255, 100)
-ORANGE = (255, 165, 0)
-PURPLE = (160, 32, 240)
-
-BRICK_COLORS = [RED, GREEN, BLUE, YELLOW, ORANGE, PURPLE]
 
-# Game settings
+# Game settings; speeds are in pixels per 60 Hz frame and scaled to the physics step
 FPS = 60
 PADDLE_SPEED = 7
 BALL_SPEED = 5
+BALL_RADIUS = 10
 LIVES = 3
 
+# Brick layout, unless a level sets its own: every brick sits in its own cell of a regular grid
+BRICK_WIDTH = 75
+BRICK_HEIGHT = 30
+BRICK_PADDING = 5
+BRICK_TOP = 60
+
+# Levels live next to the script; see load_level() for the format
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+DEFAULT_LEVEL = os.path.join(LEVEL_DIR, "classic.txt")
+
+# Most brick contacts resolved in one step; any motion left after that is dropped
+MAX_CONTACTS = 8
+
+# Multi-ball: balls in play at most, and how far split-off balls turn from their parent
+MAX_BALLS = 512
+SPLIT_ANGLE = 0.35
+
+# Brick-break effects: particles alive at most, and brick area per particle in a burst
+MAX_PARTICLES = 2048
+PARTICLE_AREA = 200
+
+# Held keys are packed into one input word per frame; this is what gets recorded
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+
 # Set up the display
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Brick Breaker")
+with startup.phase('display'):
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Brick Breaker")
 
 # Clock to control frame rate
 clock = pygame.time.Clock()
 
-# Fonts
-font = pygame.font.SysFont("Arial", 24)
+# Fonts, opened on first use
+def font():
+    return get_font("Arial", 24)
 
 # Paddle class
 class Paddle(pygame.sprite.Sprite):
@@ -49,195 +81,532 @@ class Paddle(pygame.sprite.Sprite):
         self.rect.x = (SCREEN_WIDTH - self.width) // 2
         self.rect.y = SCREEN_HEIGHT - self.height - 10
         self.speed = PADDLE_SPEED
-
-    def move_left(self):
-        self.rect.x -= self.speed
-        if self.rect.left < 0:
-            self.rect.left = 0
-
-    def move_right(self):
-        self.rect.x += self.speed
-        if self.rect.right > SCREEN_WIDTH:
-            self.rect.right = SCREEN_WIDTH
-
-# Ball class
-class Ball(pygame.sprite.Sprite):
-    def __init__(self):
-        super().__init__()
-        self.radius = 10
-        self.image = pygame.Surface([self.radius*2, self.radius*2], pygame.SRCALPHA)
-        pygame.draw.circle(self.image, WHITE, (self.radius, self.radius), self.radius)
-        self.rect = self.image.get_rect()
-        self.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-        self.speed_x = random.choice([-BALL_SPEED, BALL_SPEED])
-        self.speed_y = -BALL_SPEED
-
-    def update(self):
-        self.rect.x += self.speed_x
-        self.rect.y += self.speed_y
-
-        # Wall collision (left/right)
-        if self.rect.left <= 0 or self.rect.right >= SCREEN_WIDTH:
-            self.speed_x = -self.speed_x
-
-        # Ceiling collision
-        if self.rect.top <= 0:
-            self.speed_y = -self.speed_y
-
-    def reset(self):
-        self.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
-        self.speed_x = random.choice([-BALL_SPEED, BALL_SPEED])
-        self.speed_y = -BALL_SPEED
-
-# Brick class
-class Brick(pygame.sprite.Sprite):
-    def __init__(self, x, y, color, points):
-        super().__init__()
-        self.width = 75
-        self.height = 30
-        self.image = pygame.Surface([self.width, self.height])
-        self.image.fill(color)
-        self.rect = self.image.get_rect()
-        self.rect.x = x
-        self.rect.y = y
+        # Float x for sub-frame steps; rect is its rounded copy
+        self.x = self.prev_x = float(self.rect.x)
+
+    def move_left(self, scale=1.0):
+        self.x = max(self.x - self.speed * scale, 0)
+        self.rect.x = round(self.x)
+
+    def move_right(self, scale=1.0):
+        self.x = min(self.x + self.speed * scale, SCREEN_WIDTH - self.width)
+        self.rect.x = round(self.x)
+
+    def draw_position(self, alpha=1.0):
+        return (round(self.prev_x + (self.x - self.prev_x) * alpha), self.rect.y)
+
+# All balls in play, as arrays of positions and velocities.
+#
+# Moving, bouncing and the paddle and brick tests are batched over every ball,
+# so a multi-ball swarm costs a few array operations per step rather than a
+# Python loop per ball. Positions are floats and the previous ones are kept
+# for drawing between steps, as with the other moving objects. The arrays are
+# allocated once at MAX_BALLS; spawns beyond that are dropped.
+class Balls:
+    __slots__ = ('image', 'size', 'rng', 'count', 'pos', 'vel', 'prev')
+
+    def __init__(self, rng=random):
+        radius = BALL_RADIUS
+        self.image = pygame.Surface([radius * 2, radius * 2], pygame.SRCALPHA)
+        pygame.draw.circle(self.image, WHITE, (radius, radius), radius)
+        self.size = self.image.get_size()
+        self.rng = rng
+        self.count = 0
+        self.pos = np.zeros((MAX_BALLS, 2))
+        self.vel = np.zeros((MAX_BALLS, 2))
+        self.prev = np.zeros((MAX_BALLS, 2))
+
+    def __len__(self):
+        return self.count
+
+    def serve(self):
+        # One ball from the middle of the screen, heading up to a random side
+        if self.count == MAX_BALLS:
+            return
+        width, height = self.size
+        slot = self.count
+        self.pos[slot] = self.prev[slot] = ((SCREEN_WIDTH - width) // 2, (SCREEN_HEIGHT - height) // 2)
+        self.vel[slot] = (self.rng.choice([-BALL_SPEED, BALL_SPEED]), -BALL_SPEED)
+        self.count += 1
+
+    def split(self):
+        # Every ball in play gains two copies turned SPLIT_ANGLE either way
+        n = self.count
+        copies = min(2 * n, MAX_BALLS - n)
+        if copies <= 0:
+            return
+        cos, sin = np.cos(SPLIT_ANGLE), np.sin(SPLIT_ANGLE)
+        vx, vy = self.vel[:n, 0], self.vel[:n, 1]
+        turned = np.concatenate([np.column_stack((vx * cos - vy * sin, vx * sin + vy * cos)),
+                                 np.column_stack((vx * cos + vy * sin, vy * cos - vx * sin))])
+        self.vel[n:n + copies] = turned[:copies]
+        self.pos[n:n + copies] = np.concatenate([self.pos[:n]] * 2)[:copies]
+        self.prev[n:n + copies] = np.concatenate([self.prev[:n]] * 2)[:copies]
+        self.count += copies
+
+    def update(self, scale, bricks, paddle_rect):
+        # One step; returns the bricks broken. Balls move through the bricks in
+        # sub-steps: each advances to its earliest contact, breaks that brick and
+        # bounces off the face it hit, then carries on with the rest of its move,
+        # so a fast ball can't pass through a brick.
+        n = self.count
+        pos = self.pos[:n]
+        vel = self.vel[:n]
+        self.prev[:n] = pos
+        width, height = self.size
+        broken = []
+        remaining = np.ones(n)
+        moving = np.arange(n)
+        for _ in range(MAX_CONTACTS):
+            if not len(moving):
+                break
+            start = pos[moving]
+            move = vel[moving] * (remaining[moving] * scale)[:, None]
+            t, x_axis, cell = bricks.first_hits(start[:, 0], start[:, 1], width, height, move[:, 0], move[:, 1])
+            hit = np.isfinite(t)
+            pos[moving] = start + move * np.where(hit, t, 1.0)[:, None]
+            moving = moving[hit]
+            t = t[hit]
+            vel[moving, np.where(x_axis[hit], 0, 1)] *= -1
+            for brick_cell in cell[hit].tolist():
+                brick = bricks.cells[brick_cell]
+                # Another ball may have broken it earlier in this sub-step
+                if brick is not None and bricks.hit(brick):
+                    broken.append(brick)
+            remaining[moving] *= 1 - t
+
+        x = pos[:, 0]
+        y = pos[:, 1]
+        # Walls and ceiling turn the ball back inwards
+        vel[:, 0] = np.where(x <= 0, np.abs(vel[:, 0]), vel[:, 0])
+        vel[:, 0] = np.where(x + width >= SCREEN_WIDTH, -np.abs(vel[:, 0]), vel[:, 0])
+        vel[:, 1] = np.where(y <= 0, np.abs(vel[:, 1]), vel[:, 1])
+
+        # Paddle: bounce balls coming down onto it, angled by where they land
+        on_paddle = ((x < paddle_rect.right) & (x + width > paddle_rect.left) &
+                     (y < paddle_rect.bottom) & (y + height > paddle_rect.top) & (vel[:, 1] > 0))
+        if on_paddle.any():
+            vel[on_paddle, 1] *= -1
+            offset = (x[on_paddle] + width / 2 - paddle_rect.centerx) / (paddle_rect.width / 2)
+            vel[on_paddle, 0] = BALL_SPEED * offset
+
+        # Balls that fell below the screen leave play
+        kept = np.flatnonzero(y <= SCREEN_HEIGHT)
+        if len(kept) < n:
+            for array in (self.pos, self.vel, self.prev):
+                array[:len(kept)] = array[kept]
+            self.count = len(kept)
+        return broken
+
+    def draw(self, surface, alpha=1.0):
+        # Returns the rects drawn; `alpha` places the balls between their last two steps
+        pos = self.pos[:self.count]
+        if alpha < 1.0:
+            prev = self.prev[:self.count]
+            pos = prev + (pos - prev) * alpha
+        return surface.blits(zip(repeat(self.image), np.rint(pos).astype(np.int32).tolist()))
+
+# Brick class: no image of its own, it is drawn into the grid's brick layer
+class Brick:
+    __slots__ = ('rect', 'color', 'points', 'hits', 'power', 'cell')
+
+    def __init__(self, rect, color, points, hits, power, cell):
+        self.rect = rect
+        self.color = color
         self.points = points
-
-# Function to create a grid of bricks
-def create_bricks(rows, cols):
-    bricks = pygame.sprite.Group()
-    brick_width = 75
-    brick_height = 30
-    padding = 5
-    offset_x = (SCREEN_WIDTH - (cols * (brick_width + padding))) // 2
-    offset_y = 60
-
-    for row in range(rows):
-        for col in range(cols):
-            x = offset_x + col * (brick_width + padding)
-            y = offset_y + row * (brick_height + padding)
-            color = BRICK_COLORS[row % len(BRICK_COLORS)]
-            brick = Brick(x, y, color, points=(rows - row) * 10)
-            bricks.add(brick)
-    return bricks
-
-# Main game function
-def main():
-    # Game variables
-    paddle = Paddle()
-    ball = Ball()
-    bricks = create_bricks(6, 10)
-    all_sprites = pygame.sprite.Group()
-    all_sprites.add(paddle)
-    all_sprites.add(ball)
-    all_sprites.add(bricks)
-    lives = LIVES
-    score = 0
-    running = True
-
-    while running:
-        clock.tick(FPS)
-
-        # Event handling
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-                pygame.quit()
-                sys.exit()
+        self.hits = hits
+        self.power = power
+        self.cell = cell
+
+# Brick type from a level's legend; power is None or 'multiball'
+BrickType = namedtuple('BrickType', 'color points hits power')
+
+# A parsed level file; rows are strings of legend keys
+Level = namedtuple('Level', 'brick_size padding top legend rows')
+
+# Level files are plain text, one brick per character:
+#
+#   # comment
+#   brick 75 30 5             brick width, height and gap in pixels (optional)
+#   top 60                    y of the first row (optional)
+#   key R ff6464 60 1         legend: character, RRGGBB color, points, hits to break,
+#   key M ffffff 50 1 multiball   and optionally a power-up released when it breaks
+#   grid                      every line after this is one row of bricks;
+#   RRRR..RRRR                '.' or a space is an empty cell
+#
+# The wall has to fit across the screen and end above the middle, where
+# balls are served.
+def load_level(path):
+    brick_size = (BRICK_WIDTH, BRICK_HEIGHT)
+    padding = BRICK_PADDING
+    top = BRICK_TOP
+    legend = {}
+    with open(path) as f:
+        lines = f.read().splitlines()
+    for number, line in enumerate(lines, 1):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        try:
+            if words[0] == 'brick':
+                width, height, padding = map(int, words[1:4])
+                if width < 1 or height < 1 or padding < 0:
+                    raise ValueError
+                brick_size = (width, height)
+            elif words[0] == 'top':
+                top = int(words[1])
+            elif words[0] == 'key' and len(words[1]) == 1 and words[1] != '.' and len(words[2]) == 6:
+                if words[5:] not in ([], ['multiball']):
+                    raise ValueError
+                power = words[5] if len(words) > 5 else None
+                if int(words[4]) < 1:
+                    raise ValueError
+                legend[words[1]] = BrickType(tuple(bytes.fromhex(words[2])), int(words[3]), int(words[4]), power)
+            elif words[0] == 'grid':
+                break
+            else:
+                raise ValueError
+        except (ValueError, IndexError):
+            raise ValueError(f"{path}:{number}: bad level line {line!r}") from None
+    else:
+        raise ValueError(f"{path}: no grid section")
+
+    rows = lines[number:]
+    unknown = set(''.join(rows)) - set(legend) - set('. ')
+    if unknown:
+        raise ValueError(f"{path}: grid uses keys with no legend entry: {''.join(sorted(unknown))}")
+    width, height = brick_size
+    cols = max(map(len, rows), default=0)
+    if cols * (width + padding) > SCREEN_WIDTH:
+        raise ValueError(f"{path}: {cols} columns of {width + padding} px don't fit the {SCREEN_WIDTH} px screen")
+    filled = [row for row, line in enumerate(rows) if set(line) - set('. ')]
+    serve_top = SCREEN_HEIGHT // 2 - BALL_RADIUS
+    if filled and top + filled[-1] * (height + padding) + height > serve_top:
+        raise ValueError(f"{path}: bricks reach below y={serve_top}, where balls are served")
+    return Level(brick_size, padding, top, legend, rows)
+
+# Time of first contact for boxes moving by (dx, dy) against rects (swept AABB),
+# over arrays of box/rect pairs. Returns (t, x_axis): t in [0, 1] as a fraction
+# of the move, or inf where the pair doesn't meet, and whether the x speed (rather
+# than y) is the one that flips. Touching edges don't count, matching
+# Rect.colliderect; a pair already overlapping meets at t = 0.
+def sweep(x, y, width, height, dx, dy, left, top, right, bottom):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_entry = np.where(dx > 0, left - (x + width), right - x) / dx
+        x_exit = np.where(dx > 0, right - x, left - (x + width)) / dx
+        y_entry = np.where(dy > 0, top - (y + height), bottom - y) / dy
+        y_exit = np.where(dy > 0, bottom - y, top - (y + height)) / dy
+    # No movement on an axis: either always overlapping on it or never
+    still = dx == 0
+    x_entry[still] = np.where((x + width > left) & (x < right), -np.inf, np.inf)[still]
+    x_exit[still] = np.inf
+    still = dy == 0
+    y_entry[still] = np.where((y + height > top) & (y < bottom), -np.inf, np.inf)[still]
+    y_exit[still] = np.inf
+
+    entry = np.maximum(x_entry, y_entry)
+    meets = (entry < np.minimum(x_exit, y_exit)) & (entry <= 1) & (x_exit > 0) & (y_exit > 0)
+    return np.where(meets, np.maximum(entry, 0.0), np.inf), x_entry > y_entry
+
+# Bricks indexed by grid cell, so the ones near the ball are found by arithmetic
+# on its position instead of testing every brick.
+#
+# The bricks are drawn once into a screen-sized layer, from one shared surface
+# per color. Breaking a brick blanks its cell in the layer and queues the cell
+# as a dirty rect, so a frame costs the same however many bricks there are.
+class BrickGrid:
+    def __init__(self, level):
+        width, height = level.brick_size
+        self.cell_width = width + level.padding
+        self.cell_height = height + level.padding
+        self.rows = len(level.rows)
+        self.cols = max(map(len, level.rows), default=0)
+        self.offset_x = (SCREEN_WIDTH - self.cols * self.cell_width) // 2
+        self.offset_y = level.top
+        self.brick_size = level.brick_size
+        # Row-major, None where there is no brick; `alive` mirrors it for array lookups
+        self.cells = [None] * (self.rows * self.cols)
+        self.alive = np.zeros((self.rows, self.cols), bool)
+        self.count = 0
+
+        images = {}
+        for brick_type in level.legend.values():
+            if brick_type.color not in images:
+                images[brick_type.color] = pygame.Surface(level.brick_size).convert()
+                images[brick_type.color].fill(brick_type.color)
+
+        cells = self.cells
+        for row, line in enumerate(level.rows):
+            y = self.offset_y + row * self.cell_height
+            for col, key in enumerate(line):
+                brick_type = level.legend.get(key)
+                if brick_type is None:
+                    continue
+                cell = row * self.cols + col
+                rect = pygame.Rect(self.offset_x + col * self.cell_width, y, width, height)
+                cells[cell] = Brick(rect, brick_type.color, brick_type.points, brick_type.hits, brick_type.power, cell)
+                self.alive[row, col] = True
+                self.count += 1
+
+        self.layer = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+        self.layer.fill(BLACK)
+        self.layer.blits([(images[brick.color], brick.rect) for brick in cells if brick is not None], False)
+        # Cells changed in the layer since the last draw
+        self.dirty = []
+
+    def __len__(self):
+        return self.count
+
+    def hit(self, brick):
+        # Returns True if the hit broke the brick
+        brick.hits -= 1
+        if brick.hits > 0:
+            return False
+        self.cells[brick.cell] = None
+        self.alive.flat[brick.cell] = False
+        self.count -= 1
+        self.layer.fill(BLACK, brick.rect)
+        self.dirty.append(brick.rect)
+        return True
+
+    def first_hits(self, x, y, width, height, dx, dy):
+        # Earliest brick contact for each of a batch of moving boxes, as arrays of
+        # (t, x_axis, cell) with t = inf where a box meets nothing. Candidates
+        # come from the cells each box's swept bounds cover; ties go to the
+        # first cell in row-major order.
+        n = len(x)
+        t_hit = np.full(n, np.inf)
+        x_axis = np.zeros(n, bool)
+        cell = np.full(n, -1)
+        if not n or not self.count:
+            return t_hit, x_axis, cell
+        cell_width, cell_height = self.cell_width, self.cell_height
+        col0 = np.maximum(np.floor((np.minimum(x, x + dx) - self.offset_x) / cell_width), 0).astype(np.intp)
+        col1 = np.minimum(np.floor((np.maximum(x, x + dx) + width - self.offset_x) / cell_width),
+                          self.cols - 1).astype(np.intp)
+        row0 = np.maximum(np.floor((np.minimum(y, y + dy) - self.offset_y) / cell_height), 0).astype(np.intp)
+        row1 = np.minimum(np.floor((np.maximum(y, y + dy) + height - self.offset_y) / cell_height),
+                          self.rows - 1).astype(np.intp)
+        col_span = (col1 - col0).max() + 1
+        row_span = (row1 - row0).max() + 1
+        if col_span <= 0 or row_span <= 0:
+            return t_hit, x_axis, cell
+
+        # Every (box, row, col) the boxes cover, as one (n, row_span, col_span) block
+        rows = row0[:, None, None] + np.arange(row_span)[:, None]
+        cols = col0[:, None, None] + np.arange(col_span)
+        covered = (rows <= row1[:, None, None]) & (cols <= col1[:, None, None])
+        covered &= self.alive[np.minimum(rows, self.rows - 1), np.minimum(cols, self.cols - 1)]
+        box, row, col = np.nonzero(covered)
+        if not len(box):
+            return t_hit, x_axis, cell
+        row += row0[box]
+        col += col0[box]
+
+        left = self.offset_x + col * cell_width
+        top = self.offset_y + row * cell_height
+        width_b, height_b = self.brick_size
+        t, x_first = sweep(x[box], y[box], width, height, dx[box], dy[box], left, top, left + width_b, top + height_b)
+        np.minimum.at(t_hit, box, t)
+        first = np.flatnonzero(np.isfinite(t) & (t == t_hit[box]))
+        hit_box, index = np.unique(box[first], return_index=True)
+        first = first[index]
+        x_axis[hit_box] = x_first[first]
+        cell[hit_box] = row[first] * self.cols + col[first]
+        return t_hit, x_axis, cell
+
+def read_input():
+    keys_pressed = pygame.key.get_pressed()
+    keys = 0
+    if keys_pressed[pygame.K_LEFT]:
+        keys |= INPUT_LEFT
+    if keys_pressed[pygame.K_RIGHT]:
+        keys |= INPUT_RIGHT
+    return keys
+
+# One game, advanced a frame at a time so it can be recorded and replayed
+class Game:
+    def __init__(self, rng, hz=FPS, level=None):
+        self.paddle = Paddle()
+        self.balls = Balls(rng)
+        self.balls.serve()
+        self.bricks = BrickGrid(level or load_level(DEFAULT_LEVEL))
+        # Step length in 60 Hz frames
+        self.scale = FPS / hz
+        self.lives = LIVES
+        self.score = 0
+        self.particles = ParticlePool(MAX_PARTICLES)
+        # Rects drawn over the brick layer last frame, and whether the next frame redraws everything
+        self.drawn = []
+        self.full_redraw = True
+
+    def step(self, keys):
+        # Returns "lost" or "won" when the game ends, otherwise None
+        paddle = self.paddle
+        balls = self.balls
 
         # Key presses
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT]:
-            paddle.move_left()
-        if keys[pygame.K_RIGHT]:
-            paddle.move_right()
-
-        # Update ball
-        ball.update()
-
-        # Ball and paddle collision
-        if ball.rect.colliderect(paddle.rect):
-            ball.speed_y = -ball.speed_y
-            # Adjust ball direction based on where it hits the paddle
-            offset = (ball.rect.centerx - paddle.rect.centerx) / (paddle.width / 2)
-            ball.speed_x = BALL_SPEED * offset
-
-        # Ball and bricks collision
-        brick_collision_list = pygame.sprite.spritecollide(ball, bricks, True)
-        for brick in brick_collision_list:
-            ball.speed_y = -ball.speed_y
-            score += brick.points
-
-        # Ball falls below the paddle
-        if ball.rect.top > SCREEN_HEIGHT:
-            lives -= 1
-            if lives > 0:
-                ball.reset()
+        paddle.prev_x = paddle.x
+        if keys & INPUT_LEFT:
+            paddle.move_left(self.scale)
+        if keys & INPUT_RIGHT:
+            paddle.move_right(self.scale)
+
+        # Update balls, against the bricks, walls and paddle
+        self.particles.update(self.scale)
+        for brick in balls.update(self.scale, self.bricks, paddle.rect):
+            self.score += brick.points
+            self.particles.burst(brick.rect, max(4, brick.rect.width * brick.rect.height // PARTICLE_AREA), brick.color)
+            if brick.power == 'multiball':
+                balls.split()
+
+        # Every ball fell below the paddle
+        if not balls:
+            self.lives -= 1
+            if self.lives > 0:
+                balls.serve()
             else:
-                # Game over
-                game_over_screen(score)
-                running = False
+                return "lost"
 
         # Win condition
-        if len(bricks) == 0:
-            # Next level or win
-            win_screen(score)
-            running = False
-
-        # Drawing
-        screen.fill(BLACK)
-        all_sprites.draw(screen)
+        if len(self.bricks) == 0:
+            return "won"
+        return None
+
+    def draw(self, surface, alpha=1.0):
+        # Returns the rects that changed, or None when the whole surface was redrawn.
+        # Only last frame's sprites and text and the cells of broken bricks are
+        # restored from the brick layer; the paddle and balls are drawn between
+        # their last two steps.
+        layer = self.bricks.layer
+        if self.full_redraw:
+            surface.blit(layer, (0, 0))
+            dirty = None
+            self.full_redraw = False
+        else:
+            dirty = self.bricks.dirty + self.drawn
+            for rect in dirty:
+                surface.blit(layer, rect, rect)
+        self.bricks.dirty = []
 
         # Draw score and lives
-        score_text = font.render(f"Score: {score}", True, WHITE)
-        lives_text = font.render(f"Lives: {lives}", True, WHITE)
-        screen.blit(score_text, (20, 20))
-        screen.blit(lives_text, (SCREEN_WIDTH - 120, 20))
+        score_text = render_text(font(), f"Score: {self.score}", WHITE)
+        lives_text = render_text(font(), f"Lives: {self.lives}", WHITE)
+        self.drawn = [
+            surface.blit(self.paddle.image, self.paddle.draw_position(alpha)),
+            *self.balls.draw(surface, alpha),
+            surface.blit(score_text, (20, 20)),
+            surface.blit(lives_text, (SCREEN_WIDTH - 120, 20)),
+        ]
+        particle_rect = self.particles.draw(surface, alpha)
+        if particle_rect:
+            self.drawn.append(particle_rect)
+        return None if dirty is None else dirty + self.drawn
+
+class PlayScene(Scene):
+    idle = False
+
+    def __init__(self, rng, recorder=None, hz=FPS, level=None):
+        self.rng = rng
+        self.recorder = recorder
+        self.hz = hz
+        self.level = level
+        self.game = Game(rng, hz, level)
+
+    def handle(self, event):
+        if event.type in REDRAW_EVENTS:
+            self.game.full_redraw = True
+        return None
 
-        pygame.display.flip()
+    def update(self):
+        keys = read_input()
+        if self.recorder:
+            self.recorder.record(keys)
+        result = self.game.step(keys)
+        if result == "lost":
+            return ResultScene(self.rng, self.recorder, self.hz, self.level, "GAME OVER", self.game.score,
+                               "Press ENTER to Restart or ESC to Quit")
+        if result == "won":
+            return ResultScene(self.rng, self.recorder, self.hz, self.level, "YOU WIN!", self.game.score,
+                               "Press ENTER to Play Again or ESC to Quit")
+        return None
+
+    def draw(self, surface, alpha=1.0):
+        return self.game.draw(surface, alpha)
+
+# Game over and win screens: drawn once, then idle until a key
+class ResultScene(Scene):
+    def __init__(self, rng, recorder, hz, level, title, score, prompt):
+        self.rng = rng
+        self.recorder = recorder
+        self.hz = hz
+        self.level = level
+        self.lines = [title, f"Score: {score}", prompt]
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_RETURN:
+                return PlayScene(self.rng, self.recorder, self.hz, self.level)
+            if event.key == pygame.K_ESCAPE:
+                return EXIT
+        return None
+
+    def draw(self, surface):
+        surface.fill(BLACK)
+        for i, line in enumerate(self.lines):
+            text = render_text(font(), line, WHITE)
+            surface.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, SCREEN_HEIGHT // 2 + (i - 1) * 60))
 
-def game_over_screen(score):
-    while True:
-        screen.fill(BLACK)
-        game_over_text = font.render("GAME OVER", True, WHITE)
-        score_text = font.render(f"Score: {score}", True, WHITE)
-        restart_text = font.render("Press ENTER to Restart or ESC to Quit", True, WHITE)
-        screen.blit(game_over_text, (SCREEN_WIDTH // 2 - game_over_text.get_width() // 2, SCREEN_HEIGHT // 2 - 60))
-        screen.blit(score_text, (SCREEN_WIDTH // 2 - score_text.get_width() // 2, SCREEN_HEIGHT // 2))
-        screen.blit(restart_text, (SCREEN_WIDTH // 2 - restart_text.get_width() // 2, SCREEN_HEIGHT // 2 + 60))
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    main()
-                if event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-
-def win_screen(score):
+# Main game function
+def main(rng=None, recorder=None, hz=FPS, max_fps=FPS, level=None):
+    SceneManager(screen, hz, max_fps).run(PlayScene(rng or random.Random(), recorder, hz, level))
+    pygame.quit()
+
+def play_replay(replay, speed=0):
+    # Re-run a recorded session game by game; headless at full speed when speed is 0
+    rng = random.Random(replay.seed)
+    inputs = replay.inputs()
+    level = load_level(DEFAULT_LEVEL)
+    results = []
     while True:
-        screen.fill(BLACK)
-        win_text = font.render("YOU WIN!", True, WHITE)
-        score_text = font.render(f"Score: {score}", True, WHITE)
-        restart_text = font.render("Press ENTER to Play Again or ESC to Quit", True, WHITE)
-        screen.blit(win_text, (SCREEN_WIDTH // 2 - win_text.get_width() // 2, SCREEN_HEIGHT // 2 - 60))
-        screen.blit(score_text, (SCREEN_WIDTH // 2 - score_text.get_width() // 2, SCREEN_HEIGHT // 2))
-        screen.blit(restart_text, (SCREEN_WIDTH // 2 - restart_text.get_width() // 2, SCREEN_HEIGHT // 2 + 60))
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    main()
-                if event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
+        game = Game(rng, level=level)
+        result = None
+        for keys in inputs:
+            result = game.step(keys)
+            if speed:
+                pygame.event.pump()
+                game.draw(screen)
+                pygame.display.flip()
+                clock.tick(FPS * speed)
+            if result:
+                break
+        if result is None:
+            break
+        results.append((result, game.score))
+    return results
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Brick Breaker")
+    parser.add_argument("--level", metavar="FILE", help=f"level file to play (default: levels/{os.path.basename(DEFAULT_LEVEL)})")
+    add_timing_arguments(parser, FPS)
+    add_startup_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    startup.verbose = args.startup_timings
+    if args.physics_hz != FPS and args.record:
+        parser.error(f"recordings are made at the default {FPS} Hz physics rate")
+    if args.level and args.record:
+        parser.error("recordings are made on the default level")
+    try:
+        with startup.phase('level'):
+            level = load_level(args.level or DEFAULT_LEVEL)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    seed = args.seed if args.seed is not None else new_seed()
+    recorder = Recorder("off-the-wall", seed) if args.record else None
+    try:
+        main(random.Random(seed), recorder, args.physics_hz, args.fps, level)
+    finally:
+        if recorder:
+            recorder.save(args.record)
+
@@ -0,0 +1,111 @@
+# Pooled particles for brick breaks and row clears
+#
+# Every particle is a slot in preallocated NumPy columns (position, velocity,
+# remaining and total lifetime, color), so emitting, moving and retiring them
+# is array work and nothing is allocated per particle. The capacity is fixed:
+# a burst that doesn't fit is cut short and the rest counted in `dropped`.
+# Dead particles are culled by compacting the live ones to the front.
+#
+# Particles are written straight into the target surface's pixels through
+# surfarray, as small squares fading to black over their lifetime. Speeds and
+# lifetimes are in 60 Hz frames, like the games' other moving objects. The
+# pool draws from its own random generator, so effects never touch a game's
+# seeded RNG or its replays.
+
+import numpy as np
+import pygame
+
+
+class ParticlePool:
+    __slots__ = ('capacity', 'size', 'gravity', 'rng', 'count', 'pos', 'prev', 'vel', 'life', 'total', 'color',
+                 'dropped')
+
+    def __init__(self, capacity=1024, size=3, gravity=0.15, seed=None):
+        self.capacity = capacity
+        self.size = size
+        self.gravity = gravity
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.prev = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.life = np.zeros(capacity)
+        self.total = np.ones(capacity)
+        self.color = np.zeros((capacity, 3), np.uint8)
+        self.dropped = 0
+
+    def __len__(self):
+        return self.count
+
+    def burst(self, rect, count, color, speed=3.0, life=30):
+        # `count` particles spread over `rect`, flying out in random directions
+        n = self.count
+        k = min(count, self.capacity - n)
+        self.dropped += count - k
+        if k <= 0:
+            return
+        x, y, width, height = rect
+        r = self.rng.random((k, 4))
+        new = slice(n, n + k)
+        self.pos[new, 0] = x + r[:, 0] * width
+        self.pos[new, 1] = y + r[:, 1] * height
+        self.prev[new] = self.pos[new]
+        angle = r[:, 2] * (2 * np.pi)
+        self.vel[new, 0] = np.cos(angle) * r[:, 3] * speed
+        self.vel[new, 1] = np.sin(angle) * r[:, 3] * speed
+        # Lifetimes vary by up to half so a burst thins out instead of vanishing at once
+        self.life[new] = self.total[new] = life * (1 - r[:, 0] * 0.5)
+        self.color[new] = color
+        self.count = n + k
+
+    def clear(self):
+        self.count = 0
+
+    def update(self, scale=1.0):
+        # One step; `scale` is the step length in 60 Hz frames
+        n = self.count
+        if not n:
+            return
+        pos = self.pos[:n]
+        self.prev[:n] = pos
+        pos += self.vel[:n] * scale
+        self.vel[:n, 1] += self.gravity * scale
+        life = self.life[:n]
+        life -= scale
+        if (life <= 0).any():
+            live = np.flatnonzero(life > 0)
+            for array in (self.pos, self.prev, self.vel, self.life, self.total, self.color):
+                array[:len(live)] = array[live]
+            self.count = len(live)
+
+    def draw(self, surface, alpha=1.0, clip=None):
+        # Returns the rect drawn over (None if nothing was), limited to `clip`
+        n = self.count
+        if not n:
+            return None
+        pos = self.pos[:n]
+        if alpha < 1.0:
+            prev = self.prev[:n]
+            pos = prev + (pos - prev) * alpha
+        clip = pygame.Rect(clip or surface.get_rect()).clip(surface.get_rect())
+        x = np.rint(pos[:, 0]).astype(np.intp)
+        y = np.rint(pos[:, 1]).astype(np.intp)
+        fade = self.life[:n] / self.total[:n]
+        color = (self.color[:n] * fade[:, None]).astype(np.uint8)
+
+        size = self.size
+        inside = (x + size > clip.left) & (x < clip.right) & (y + size > clip.top) & (y < clip.bottom)
+        if not inside.any():
+            return None
+        x, y, color = x[inside], y[inside], color[inside]
+        pixels = pygame.surfarray.pixels3d(surface)
+        for dx in range(size):
+            px = x + dx
+            column = (px >= clip.left) & (px < clip.right)
+            for dy in range(size):
+                py = y + dy
+                on = column & (py >= clip.top) & (py < clip.bottom)
+                pixels[px[on], py[on]] = color[on]
+        del pixels
+        left, top = x.min(), y.min()
+        return pygame.Rect(left, top, x.max() + size - left, y.max() + size - top).clip(clip)
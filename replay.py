@@ -0,0 +1,174 @@
+# Deterministic session recording and replay for all the games
+#
+# A recording is the RNG seed plus one input word per logic frame (held-key
+# bitmask or action code, depending on the game). Only the frames where the
+# word changes are stored, as varint-packed (frame delta, value) pairs, so a
+# long session is a few kilobytes.
+#
+# Record:  python main.py --record run.krec [--seed N]
+# Replay:  python replay.py run.krec            (headless, as fast as possible)
+#          python replay.py run.krec --speed 4  (rendered at 4x)
+
+import argparse
+import importlib.util
+import os
+import random
+import struct
+import sys
+import time
+
+MAGIC = b'KGRP'
+VERSION = 1
+HEADER = struct.Struct('<4sBQI')  # magic, version, seed, frame count
+
+# Recording name -> script that can replay it
+GAMES = {
+    'squirrel-finder': 'main.py',
+    'off-the-wall': 'off-the-wall.py',
+    'tetris': 'tetris.py',
+    'tetris-claude': 'tetris-claude.py',
+}
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+
+def _write_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+class Recorder:
+    def __init__(self, game, seed):
+        self.game = game
+        self.seed = seed
+        self.frames = 0
+        self.value = 0
+        self.changes = []
+
+    def record(self, value):
+        # Call exactly once per logic frame with that frame's input word
+        if value != self.value:
+            self.changes.append((self.frames, value))
+            self.value = value
+        self.frames += 1
+
+    def save(self, path):
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.seed, self.frames))
+        name = self.game.encode()
+        out.append(len(name))
+        out += name
+        _write_varint(out, len(self.changes))
+        last = 0
+        for frame, value in self.changes:
+            _write_varint(out, frame - last)
+            _write_varint(out, value)
+            last = frame
+        with open(path, 'wb') as f:
+            f.write(out)
+
+
+class Replay:
+    def __init__(self, game, seed, frames, changes):
+        self.game = game
+        self.seed = seed
+        self.frames = frames
+        self.changes = changes
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, seed, frames = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} recording')
+        pos = HEADER.size
+        name_length = data[pos]
+        game = data[pos + 1:pos + 1 + name_length].decode()
+        pos += 1 + name_length
+        count, pos = _read_varint(data, pos)
+        changes = []
+        frame = 0
+        for _ in range(count):
+            delta, pos = _read_varint(data, pos)
+            value, pos = _read_varint(data, pos)
+            frame += delta
+            changes.append((frame, value))
+        return cls(game, seed, frames, changes)
+
+    def inputs(self):
+        # One input word per recorded frame
+        value = 0
+        changes = iter(self.changes)
+        change = next(changes, None)
+        for frame in range(self.frames):
+            while change is not None and change[0] == frame:
+                value = change[1]
+                change = next(changes, None)
+            yield value
+
+
+def _seed(text):
+    # The header stores the seed as an unsigned 64-bit int
+    try:
+        seed = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid seed: {text!r}")
+    if not 0 <= seed < 1 << 64:
+        raise argparse.ArgumentTypeError(f"seed must be between 0 and {(1 << 64) - 1}")
+    return seed
+
+def add_arguments(parser):
+    parser.add_argument('--record', metavar='PATH', help='record this session to PATH')
+    parser.add_argument('--seed', type=_seed, help='RNG seed (random if not given)')
+
+def load_game(script):
+    # Game scripts have dashes in their names, so import them by path
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(script)[0].replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded game session')
+    parser.add_argument('path')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='render at this multiple of real time (0 = headless, max speed)')
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    if not args.speed:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    if replay.game not in GAMES:
+        sys.exit(f'unknown game {replay.game!r} in {args.path}')
+
+    game = load_game(GAMES[replay.game])
+    start = time.perf_counter()
+    result = game.play_replay(replay, args.speed)
+    elapsed = time.perf_counter() - start
+    print(f'{replay.game}: {replay.frames} frames in {elapsed:.3f}s '
+          f'({replay.frames / max(elapsed, 1e-9):.0f} frames/s), result: {result}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Scene manager shared by the games
+#
+# A game is a chain of scenes (menu, play, game over, ...). The manager runs
+# one scene at a time and switches when a scene returns the next one, so a
+# restart is just a new play scene, never a recursive call.
+#
+# Idle scenes (menus, result screens) draw once and then sleep in
+# pygame.event.wait until input arrives or their timer runs out, so a game left
+# on its menu uses no CPU. Active scenes update on a fixed timestep and draw
+# interpolated frames at up to max_fps, through FrameScheduler.
+
+import time
+
+import pygame
+
+from frame_pacing import FrameScheduler
+from startup import startup
+
+# Returned instead of a scene to stop the manager
+EXIT = 'exit'
+
+# Events after which an idle scene has to be drawn again
+REDRAW_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED)
+
+
+class Scene:
+    idle = True
+    # Seconds until timeout() is called, for timed transitions (None = no timer)
+    duration = None
+
+    def enter(self):
+        pass
+
+    def handle(self, event):
+        # Return the next scene (or EXIT) to switch, None to stay
+        return None
+
+    def update(self):
+        # Active scenes only: one fixed logic step, returning a scene to switch
+        return None
+
+    def timeout(self):
+        return None
+
+    def draw(self, surface, alpha=1.0):
+        # `alpha` places the frame between the last two logic steps (active scenes).
+        # An active scene may return the rects it changed to update only those.
+        return None
+
+
+class SceneManager:
+    def __init__(self, surface, update_hz=60, max_fps=60):
+        self.surface = surface
+        self.update_hz = update_hz
+        self.max_fps = max_fps
+
+    def run(self, scene):
+        # Runs until a scene returns EXIT or the window is closed
+        while scene is not None and scene != EXIT:
+            scene = self.run_scene(scene)
+
+    def run_scene(self, scene):
+        scene.enter()
+        deadline = time.perf_counter() + scene.duration if scene.duration is not None else None
+        redraw = True
+        scheduler = None if scene.idle else FrameScheduler(self.update_hz, self.max_fps)
+
+        while True:
+            if scene.idle:
+                if redraw:
+                    scene.draw(self.surface)
+                    pygame.display.flip()
+                    startup.first_frame()
+                    redraw = False
+                if deadline is None:
+                    events = [pygame.event.wait()]
+                else:
+                    wait = int((deadline - time.perf_counter()) * 1000)
+                    events = [pygame.event.wait(wait)] if wait > 0 else []
+                events.extend(pygame.event.get())
+            else:
+                events = scheduler.poll()
+
+            for event in events:
+                if event.type == pygame.NOEVENT:
+                    continue
+                if event.type == pygame.QUIT:
+                    return EXIT
+                if event.type in REDRAW_EVENTS:
+                    redraw = True
+                next_scene = scene.handle(event)
+                if next_scene is not None:
+                    return next_scene
+
+            if deadline is not None and time.perf_counter() >= deadline:
+                next_scene = scene.timeout()
+                if next_scene is not None:
+                    return next_scene
+                deadline = None
+
+            if not scene.idle:
+                for _ in range(scheduler.updates()):
+                    next_scene = scene.update()
+                    if next_scene is not None:
+                        return next_scene
+                # Every frame moves things on screen, even without a new step
+                scheduler.request_render()
+                if scheduler.should_render():
+                    rects = scene.draw(self.surface, scheduler.alpha())
+                    if rects is None:
+                        pygame.display.flip()
+                    else:
+                        pygame.display.update(rects)
+                    startup.first_frame()
+                    scheduler.rendered()
@@ -0,0 +1,69 @@
+# Startup for the games: only the pygame subsystems they use, and where the time goes
+#
+# pygame.init() starts every subsystem pygame has, audio and joysticks
+# included, and opening the audio device is often the slowest part of a cold
+# start. The games only draw and read keys, so init() brings up just the
+# display and fonts. Fonts and images are created on first use (text_cache,
+# assets) rather than at import, so their cost moves into the first frame,
+# where it is reported along with the rest.
+#
+# The timer runs from init() to the first frame on screen. With
+# --startup-timings, first_frame() prints the breakdown.
+
+import time
+from contextlib import contextmanager
+
+import pygame
+
+from assets import assets
+from text_cache import text_cache
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = None
+        self.phases = []
+        self.first_frame_ms = None
+        self.verbose = False
+
+    def init(self):
+        self.started = time.perf_counter()
+        with self.phase('init'):
+            pygame.display.init()
+            pygame.font.init()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - start) * 1000))
+
+    def first_frame(self):
+        # Call after every flip; only the first one counts
+        if self.first_frame_ms is not None or self.started is None:
+            return
+        self.first_frame_ms = (time.perf_counter() - self.started) * 1000
+        if self.verbose:
+            print(self.report())
+
+    def report(self):
+        parts = [f"{name} {ms:.1f} ms" for name, ms in self.phases]
+        stats = text_cache.stats()
+        if stats['font_misses']:
+            parts.append(f"fonts {stats['font_ms']:.1f} ms ({stats['font_misses']} loaded)")
+        if assets.timings:
+            image_ms = sum(t['load_ms'] + t['scale_ms'] + t['convert_ms'] for t in assets.timings.values())
+            parts.append(f"images {image_ms:.1f} ms ({len(assets.timings)} loaded)")
+        if self.first_frame_ms is not None:
+            parts.append(f"first frame at {self.first_frame_ms:.1f} ms")
+        return "startup: " + ", ".join(parts)
+
+
+# Shared by the games
+startup = StartupTimer()
+
+def add_startup_arguments(parser):
+    parser.add_argument('--startup-timings', action='store_true',
+                        help='print where startup time went once the first frame is shown')
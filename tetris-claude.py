@@ -1,8 +1,19 @@
+import argparse
+import math
 import pygame
 import random
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
-# Initialize Pygame
-pygame.init()
+from frame_pacing import FrameScheduler
+from particles import ParticlePool
+from replay import Recorder, add_arguments, new_seed
+from startup import add_startup_arguments, startup
+from tetris_ai import AutoPlayer, Searcher, ROTATE, LEFT, RIGHT, DOWN
+from text_cache import get_font, render_text
+
+# Initialize only the pygame subsystems the game uses
+startup.init()
 
 # Colors
 BLACK = (0, 0, 0)
@@ -22,6 +33,18 @@ GRID_HEIGHT = 20
 SCREEN_WIDTH = BLOCK_SIZE * (GRID_WIDTH + 6)
 SCREEN_HEIGHT = BLOCK_SIZE * GRID_HEIGHT
 
+# Timing: logic runs at a fixed rate, drawing is capped separately
+TICKS_PER_SECOND = 60
+MAX_FPS = 60
+
+# Row-clear effect: particles per cleared block, and most alive per board
+PARTICLES_PER_CELL = 6
+MAX_PARTICLES = 512
+
+# Arena mode: boards are shrunk to fit a window of at most this size
+ARENA_MAX_SIZE = (1600, 900)
+ARENA_BORDER = (64, 64, 64)
+
 # Tetromino shapes
 SHAPES = [
     [[1, 1, 1, 1]],
@@ -35,130 +58,458 @@ SHAPES = [
 
 COLORS = [CYAN, YELLOW, MAGENTA, RED, GREEN, BLUE, ORANGE]
 
+# The board stores palette indexes, 0 for an empty cell
+PALETTE = [BLACK] + COLORS
+COLOR_INDEX = {color: i for i, color in enumerate(PALETTE)}
+EMPTY_CELLS = bytes(GRID_WIDTH)
+
+# Board rows are also kept as bitmasks (bit x = column x occupied)
+FULL_ROW = (1 << GRID_WIDTH) - 1
+
+# Auto-player actions are fed through the same key handling as a human
+AI_KEYS = {ROTATE: pygame.K_UP, LEFT: pygame.K_LEFT, RIGHT: pygame.K_RIGHT, DOWN: pygame.K_DOWN}
+
+# Keys as recorded in replays: 0 is no key, otherwise 1 + index
+INPUT_KEYS = [pygame.K_LEFT, pygame.K_RIGHT, pygame.K_DOWN, pygame.K_UP, pygame.K_SPACE]
+
+# One rotation of a shape: row bitmasks plus the first and last filled row of each column
+RotationState = namedtuple("RotationState", "shape masks width tops bottoms")
+
+def rotation_states(shape):
+    # All four clockwise turns, computed once per shape at startup
+    states = []
+    for _ in range(4):
+        shape = tuple(tuple(row) for row in shape)
+        columns = range(len(shape[0]))
+        states.append(RotationState(
+            shape,
+            tuple(sum(1 << x for x, cell in enumerate(row) if cell) for row in shape),
+            len(shape[0]),
+            tuple(min(y for y, row in enumerate(shape) if row[x]) for x in columns),
+            tuple(max(y for y, row in enumerate(shape) if row[x]) for x in columns)))
+        shape = list(zip(*shape[::-1]))
+    return tuple(states)
+
+ROTATIONS = [rotation_states(shape) for shape in SHAPES]
+
 class Tetromino:
-    def __init__(self):
-        self.shape = random.choice(SHAPES)
-        self.color = random.choice(COLORS)
-        self.x = GRID_WIDTH // 2 - len(self.shape[0]) // 2
+    def __init__(self, rng=random):
+        self.rotations = rng.choice(ROTATIONS)
+        self.rotation = 0
+        self.color = rng.choice(COLORS)
+        self.x = GRID_WIDTH // 2 - self.state.width // 2
         self.y = 0
 
+    @property
+    def state(self):
+        return self.rotations[self.rotation]
+
+    @property
+    def shape(self):
+        return self.rotations[self.rotation].shape
+
     def rotate(self):
-        self.shape = list(zip(*self.shape[::-1]))
+        self.rotation = (self.rotation + 1) % 4
 
 class TetrisGame:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Tetris")
-        self.clock = pygame.time.Clock()
-        self.grid = [[BLACK for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-        self.current_piece = Tetromino()
-        self.next_piece = Tetromino()
+    def __init__(self, autoplay=False, workers=0, seed=None, recorder=None, surface=None, searcher=None,
+                 block_size=BLOCK_SIZE, lookahead=True, pool=None):
+        # Without a surface the game owns the window; an arena passes an off-screen one
+        if surface is None:
+            with startup.phase('display'):
+                surface = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+                pygame.display.set_caption("Tetris")
+        self.screen = surface
+        # Arena boards are drawn with smaller blocks
+        self.block_size = block_size
+        self.scale = block_size / BLOCK_SIZE
+        # Row-major palette indexes; clearing a row is a memmove plus a zero-fill
+        self.cells = bytearray(GRID_WIDTH * GRID_HEIGHT)
+        # Collision works on row bitmasks; column_tops is the first filled row per column
+        self.rows = [0] * GRID_HEIGHT
+        self.column_tops = [GRID_HEIGHT] * GRID_WIDTH
+        # Blocks per row, kept up to date on merge, and rows that filled up
+        self.fill = [0] * GRID_HEIGHT
+        self.completed = []
+        self.board_layer = pygame.Surface((GRID_WIDTH * block_size, GRID_HEIGHT * block_size))
+        self.board_changed = True
+        # Sized with the blocks, so arena boards get proportionally smaller bursts
+        self.particles = ParticlePool(MAX_PARTICLES, size=max(1, round(3 * self.scale)), gravity=0.15 * self.scale)
+        self.rng = random.Random(seed)
+        self.current_piece = Tetromino(self.rng)
+        self.next_piece = Tetromino(self.rng)
         self.score = 0
-        self.font = pygame.font.Font(None, 36)
+        # The font is opened on first draw
+        self.font_size = max(12, round(36 * self.scale))
+        self.fall_ticks = 0
+        self.fall_speed = 0.5
+        self.running = True
+        self.dirty = True
+        self.pieces = 0
+        # Keys are applied on logic ticks, one per tick, so a session can be replayed
+        self.keys = deque()
+        self.recorder = recorder
+        self.autoplayer = AutoPlayer(GRID_WIDTH, GRID_HEIGHT, lookahead, workers, searcher, pool) if autoplay else None
 
     def draw_grid(self):
-        for y, row in enumerate(self.grid):
-            for x, color in enumerate(row):
-                pygame.draw.rect(self.screen, color, (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 0)
+        # Locked blocks only change when a piece merges, so they are kept in a layer
+        if self.board_changed:
+            size = self.block_size
+            self.board_layer.fill(BLACK)
+            for i, index in enumerate(self.cells):
+                if not index:
+                    continue
+                y, x = divmod(i, GRID_WIDTH)
+                pygame.draw.rect(self.board_layer, PALETTE[index], (x * size, y * size, size, size), 0)
+            self.board_changed = False
+        self.screen.blit(self.board_layer, (0, 0))
 
     def draw_piece(self, piece, offset_x=0, offset_y=0):
+        size = self.block_size
         for y, row in enumerate(piece.shape):
             for x, cell in enumerate(row):
                 if cell:
                     pygame.draw.rect(self.screen, piece.color,
-                                     ((piece.x + x + offset_x) * BLOCK_SIZE,
-                                      (piece.y + y + offset_y) * BLOCK_SIZE,
-                                      BLOCK_SIZE, BLOCK_SIZE), 0)
+                                     ((piece.x + x + offset_x) * size,
+                                      (piece.y + y + offset_y) * size,
+                                      size, size), 0)
+
+    def draw_ghost(self):
+        # Outline where a hard drop would land the current piece
+        piece = self.current_piece
+        size = self.block_size
+        ghost_y = self.drop_y(piece)
+        if ghost_y == piece.y:
+            return
+        for y, row in enumerate(piece.shape):
+            for x, cell in enumerate(row):
+                if cell:
+                    pygame.draw.rect(self.screen, piece.color,
+                                     ((piece.x + x) * size,
+                                      (ghost_y + y) * size,
+                                      size, size), 1)
 
     def draw_next_piece(self):
+        size = self.block_size
         for y, row in enumerate(self.next_piece.shape):
             for x, cell in enumerate(row):
                 if cell:
                     pygame.draw.rect(self.screen, self.next_piece.color,
-                                     ((GRID_WIDTH + 1 + x) * BLOCK_SIZE,
-                                      (1 + y) * BLOCK_SIZE,
-                                      BLOCK_SIZE, BLOCK_SIZE), 0)
+                                     ((GRID_WIDTH + 1 + x) * size,
+                                      (1 + y) * size,
+                                      size, size), 0)
 
-    def check_collision(self, piece, offset_x=0, offset_y=0):
-        for y, row in enumerate(piece.shape):
-            for x, cell in enumerate(row):
-                if cell:
-                    if (piece.x + x + offset_x < 0 or
-                        piece.x + x + offset_x >= GRID_WIDTH or
-                        piece.y + y + offset_y >= GRID_HEIGHT or
-                        self.grid[piece.y + y + offset_y][piece.x + x + offset_x] != BLACK):
-                        return True
+    def check_collision(self, piece, offset_x=0, offset_y=0, state=None):
+        # `state` tests a rotation other than the piece's current one
+        state = state or piece.state
+        x = piece.x + offset_x
+        y = piece.y + offset_y
+        if x < 0 or x + state.width > GRID_WIDTH or y + len(state.masks) > GRID_HEIGHT:
+            return True
+        for dy, bits in enumerate(state.masks):
+            if self.rows[y + dy] & (bits << x):
+                return True
         return False
 
+    def drop_y(self, piece):
+        # Landing row straight from the column heightmap, O(piece width)
+        state = piece.state
+        y = min(self.column_tops[piece.x + c] - 1 - bottom for c, bottom in enumerate(state.bottoms))
+        if y < piece.y:
+            # Piece has slid under an overhang; step down from where it is
+            y = piece.y
+            while not self.check_collision(piece, offset_y=y + 1 - piece.y):
+                y += 1
+        return y
+
     def merge_piece(self):
-        for y, row in enumerate(self.current_piece.shape):
-            for x, cell in enumerate(row):
+        piece = self.current_piece
+        state = piece.state
+        index = COLOR_INDEX[piece.color]
+        self.board_changed = True
+        for dy, bits in enumerate(state.masks):
+            y = piece.y + dy
+            start = y * GRID_WIDTH + piece.x
+            for x, cell in enumerate(state.shape[dy]):
                 if cell:
-                    self.grid[self.current_piece.y + y][self.current_piece.x + x] = self.current_piece.color
+                    self.cells[start + x] = index
+            # A piece spawned over existing blocks may overlap them, so count new bits only
+            added = (bits << piece.x) & ~self.rows[y]
+            self.rows[y] |= added
+            # Only rows this piece touched can have become full
+            self.fill[y] += bin(added).count('1')
+            if self.fill[y] == GRID_WIDTH:
+                self.completed.append(y)
+        for c, top in enumerate(state.tops):
+            self.column_tops[piece.x + c] = min(self.column_tops[piece.x + c], piece.y + top)
 
     def remove_full_rows(self):
-        full_rows = [i for i, row in enumerate(self.grid) if all(cell != BLACK for cell in row)]
+        full_rows = sorted(self.completed)
+        self.completed = []
+        self.burst_rows(full_rows)
+        # Top-down, each clear shifts only the rows above it; rows below keep their index
         for row in full_rows:
-            del self.grid[row]
-            self.grid.insert(0, [BLACK for _ in range(GRID_WIDTH)])
+            self.cells[GRID_WIDTH:(row + 1) * GRID_WIDTH] = self.cells[:row * GRID_WIDTH]
+            self.cells[:GRID_WIDTH] = EMPTY_CELLS
+            self.rows[1:row + 1] = self.rows[:row]
+            self.rows[0] = 0
+            self.fill[1:row + 1] = self.fill[:row]
+            self.fill[0] = 0
+        if full_rows:
+            self.update_column_tops()
         self.score += len(full_rows) ** 2 * 100
 
+    def burst_rows(self, rows):
+        # Each block of a cleared row bursts in its own color
+        size = self.block_size
+        for row in rows:
+            for x, index in enumerate(self.cells[row * GRID_WIDTH:(row + 1) * GRID_WIDTH]):
+                self.particles.burst((x * size, row * size, size, size), PARTICLES_PER_CELL, PALETTE[index],
+                                     speed=3.0 * self.scale)
+
+    def update_column_tops(self):
+        # Rebuild the heightmap after rows move; each column is found once
+        tops = [GRID_HEIGHT] * GRID_WIDTH
+        seen = 0
+        for y, bits in enumerate(self.rows):
+            new = bits & ~seen
+            while new:
+                low = new & -new
+                tops[low.bit_length() - 1] = y
+                new ^= low
+            seen |= bits
+            if seen == FULL_ROW:
+                break
+        self.column_tops = tops
+
+    def lock_piece(self):
+        self.merge_piece()
+        self.remove_full_rows()
+        self.current_piece = self.next_piece
+        self.next_piece = Tetromino(self.rng)
+        self.pieces += 1
+        if self.game_over():
+            self.running = False
+
     def game_over(self):
-        return any(cell != BLACK for cell in self.grid[0])
+        return self.fill[0] != 0
+
+    def handle_key(self, key):
+        if key == pygame.K_LEFT:
+            if not self.check_collision(self.current_piece, offset_x=-1):
+                self.current_piece.x -= 1
+        if key == pygame.K_RIGHT:
+            if not self.check_collision(self.current_piece, offset_x=1):
+                self.current_piece.x += 1
+        if key == pygame.K_DOWN:
+            if not self.check_collision(self.current_piece, offset_y=1):
+                self.current_piece.y += 1
+        if key == pygame.K_UP:
+            piece = self.current_piece
+            if not self.check_collision(piece, state=piece.rotations[(piece.rotation + 1) % 4]):
+                piece.rotate()
+        if key == pygame.K_SPACE:
+            # Hard drop: land and lock at once
+            self.current_piece.y = self.drop_y(self.current_piece)
+            self.lock_piece()
+            self.fall_ticks = 0
+        self.dirty = True
+
+    def update(self, key=None):
+        # One fixed logic tick; `key` overrides the queued input (replays pass 0 for no key)
+        if key is None:
+            if self.autoplayer:
+                key = AI_KEYS[self.autoplayer.next_action(self.rows, self.current_piece, self.next_piece, self.pieces)]
+            elif self.keys:
+                key = self.keys.popleft()
+        if self.recorder:
+            self.recorder.record(INPUT_KEYS.index(key) + 1 if key in INPUT_KEYS else 0)
+        if key:
+            self.handle_key(key)
+
+        # Frames with particles in flight are never identical
+        if self.particles:
+            self.particles.update()
+            self.dirty = True
+
+        self.fall_ticks += 1
+        if self.fall_ticks / TICKS_PER_SECOND > self.fall_speed:
+            if not self.check_collision(self.current_piece, offset_y=1):
+                self.current_piece.y += 1
+            else:
+                self.lock_piece()
+            self.fall_ticks = 0
+            self.dirty = True
+
+    def draw(self):
+        self.screen.fill(BLACK)
+        self.draw_grid()
+        self.draw_ghost()
+        self.draw_piece(self.current_piece)
+        self.draw_next_piece()
+        self.particles.draw(self.screen, clip=self.board_layer.get_rect())
+
+        score_text = render_text(get_font(None, self.font_size), f"Score: {self.score}", WHITE)
+        self.screen.blit(score_text, (GRID_WIDTH * self.block_size + round(10 * self.scale), round(200 * self.scale)))
+
+    def run(self, inputs=None, speed=1, frame_stats=False):
+        # With `inputs` (a replay) keys come from the recording instead of the keyboard
+        scheduler = FrameScheduler(TICKS_PER_SECOND * speed, MAX_FPS)
+
+        while self.running:
+            # Sleeps until a key arrives or the next tick is due
+            for event in scheduler.poll():
+                if event.type == pygame.QUIT:
+                    self.running = False
+                # Keys only drive a human game; the AI and replays would never read them
+                if (event.type == pygame.KEYDOWN and event.key in INPUT_KEYS
+                        and inputs is None and not self.autoplayer):
+                    self.keys.append(event.key)
+
+            for _ in range(scheduler.updates()):
+                if not self.running:
+                    break
+                if inputs is None:
+                    self.update()
+                    continue
+                code = next(inputs, None)
+                if code is None:
+                    self.running = False
+                    break
+                self.update(INPUT_KEYS[code - 1] if code else 0)
+
+            # Identical frames are not redrawn
+            if self.dirty:
+                scheduler.request_render()
+                self.dirty = False
+            if scheduler.should_render():
+                self.draw()
+                pygame.display.flip()
+                startup.first_frame()
+                scheduler.rendered()
+
+        if frame_stats:
+            print(scheduler.report())
+        if self.autoplayer:
+            self.autoplayer.close()
+        pygame.quit()
+
+class Arena:
+    # Many auto-played boards in one process: one scheduler, one window, one flip per frame
+    def __init__(self, count, seed=None, workers=0, columns=None, lookahead=False):
+        columns = columns or math.ceil(math.sqrt(count))
+        rows = math.ceil(count / columns)
+        # Boards are drawn at a block size that fits, never scaled afterwards
+        block_size = min(BLOCK_SIZE,
+                         ARENA_MAX_SIZE[0] // (columns * (GRID_WIDTH + 6)),
+                         ARENA_MAX_SIZE[1] // (rows * GRID_HEIGHT))
+        block_size = max(block_size, 4)
+        tile_width = block_size * (GRID_WIDTH + 6)
+        tile_height = block_size * GRID_HEIGHT
+        with startup.phase('display'):
+            self.window = pygame.display.set_mode((columns * tile_width, rows * tile_height))
+            pygame.display.set_caption(f"Tetris arena ({count} boards)")
+
+        # Board seeds come from the arena seed, so a whole arena can be rerun
+        rng = random.Random(seed)
+        # One search cache for every board; early boards in particular repeat each other.
+        # Likewise one worker pool, so the process count doesn't grow with the boards
+        searcher = Searcher(GRID_WIDTH, GRID_HEIGHT)
+        self.pool = ProcessPoolExecutor(workers) if workers > 1 and lookahead else None
+        self.games = []
+        self.tiles = []
+        for i in range(count):
+            surface = pygame.Surface((tile_width, tile_height))
+            self.games.append(TetrisGame(autoplay=True, workers=workers, seed=rng.getrandbits(63),
+                                         surface=surface, searcher=searcher, block_size=block_size,
+                                         lookahead=lookahead, pool=self.pool))
+            row, column = divmod(i, columns)
+            self.tiles.append(pygame.Rect(column * tile_width, row * tile_height, tile_width, tile_height))
+        self.font_size = max(12, block_size * 8 // 5)
+
+    def draw_board(self, game, tile):
+        # Boards are only redrawn when they changed; the result stays on the window
+        game.draw()
+        if not game.running:
+            text = render_text(get_font(None, self.font_size), "GAME OVER", WHITE)
+            game.screen.blit(text, (GRID_WIDTH * game.block_size // 2 - text.get_width() // 2,
+                                    GRID_HEIGHT * game.block_size // 2))
+        self.window.blit(game.screen, tile)
+        pygame.draw.rect(self.window, ARENA_BORDER, tile, 1)
+        game.dirty = False
 
     def run(self):
-        fall_time = 0
-        fall_speed = 0.5
+        scheduler = FrameScheduler(TICKS_PER_SECOND, MAX_FPS)
         running = True
 
         while running:
-            fall_time += self.clock.get_rawtime()
-            self.clock.tick()
-
-            for event in pygame.event.get():
+            for event in scheduler.poll():
                 if event.type == pygame.QUIT:
                     running = False
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT:
-                        if not self.check_collision(self.current_piece, offset_x=-1):
-                            self.current_piece.x -= 1
-                    if event.key == pygame.K_RIGHT:
-                        if not self.check_collision(self.current_piece, offset_x=1):
-                            self.current_piece.x += 1
-                    if event.key == pygame.K_DOWN:
-                        if not self.check_collision(self.current_piece, offset_y=1):
-                            self.current_piece.y += 1
-                    if event.key == pygame.K_UP:
-                        rotated = Tetromino()
-                        rotated.shape = list(zip(*self.current_piece.shape[::-1]))
-                        rotated.x, rotated.y = self.current_piece.x, self.current_piece.y
-                        if not self.check_collision(rotated):
-                            self.current_piece = rotated
-
-            if fall_time / 1000 > fall_speed:
-                if not self.check_collision(self.current_piece, offset_y=1):
-                    self.current_piece.y += 1
-                else:
-                    self.merge_piece()
-                    self.remove_full_rows()
-                    self.current_piece = self.next_piece
-                    self.next_piece = Tetromino()
-                    if self.game_over():
-                        running = False
-                fall_time = 0
-
-            self.screen.fill(BLACK)
-            self.draw_grid()
-            self.draw_piece(self.current_piece)
-            self.draw_next_piece()
-
-            score_text = self.font.render(f"Score: {self.score}", True, WHITE)
-            self.screen.blit(score_text, (GRID_WIDTH * BLOCK_SIZE + 10, 200))
-
-            pygame.display.flip()
 
+            for _ in range(scheduler.updates()):
+                for game in self.games:
+                    if game.running:
+                        game.update()
+
+            if any(game.dirty for game in self.games):
+                scheduler.request_render()
+            if scheduler.should_render():
+                for game, tile in zip(self.games, self.tiles):
+                    if game.dirty:
+                        self.draw_board(game, tile)
+                pygame.display.flip()
+                startup.first_frame()
+                scheduler.rendered()
+
+            if not any(game.running for game in self.games):
+                running = False
+
+        print(scheduler.report())
+        for rank, (i, game) in enumerate(sorted(enumerate(self.games), key=lambda item: -item[1].score), 1):
+            print(f"{rank:3}. board {i + 1}: {game.score} points, {game.pieces} pieces")
+        for game in self.games:
+            game.autoplayer.close()
+        if self.pool is not None:
+            self.pool.shutdown()
         pygame.quit()
 
+def play_replay(replay, speed=0):
+    # Re-run a recorded game; headless at full speed when speed is 0
+    game = TetrisGame(seed=replay.seed)
+    if speed:
+        game.run(replay.inputs(), speed)
+    else:
+        for code in replay.inputs():
+            game.update(INPUT_KEYS[code - 1] if code else 0)
+            if not game.running:
+                break
+        pygame.quit()
+    return {'score': game.score, 'pieces': game.pieces}
+
 if __name__ == "__main__":
-    game = TetrisGame()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tetris")
+    parser.add_argument("--autoplay", action="store_true", help="let the built-in AI play")
+    parser.add_argument("--workers", type=int, default=0, help="processes for the AI lookahead search")
+    parser.add_argument("--arena", type=int, metavar="N", help="run N auto-played boards side by side")
+    parser.add_argument("--lookahead", action="store_true",
+                        help="arena boards also search the next piece (several times the CPU per board)")
+    parser.add_argument("--frame-stats", action="store_true", help="print frame pacing stats when the game ends")
+    add_startup_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    startup.verbose = args.startup_timings
+
+    if args.arena:
+        if args.record:
+            parser.error("--record is not supported with --arena")
+        Arena(args.arena, seed=args.seed, workers=args.workers, lookahead=args.lookahead).run()
+    else:
+        seed = args.seed if args.seed is not None else new_seed()
+        recorder = Recorder("tetris-claude", seed) if args.record else None
+        game = TetrisGame(autoplay=args.autoplay, workers=args.workers, seed=seed, recorder=recorder)
+        try:
+            game.run(frame_stats=args.frame_stats)
+        finally:
+            if recorder:
+                recorder.save(args.record)
@@ -1,9 +1,21 @@
+import argparse
 import pygame
-import sys
 import random
+import sys
+from collections import deque
+
+from frame_pacing import FrameScheduler
+from particles import ParticlePool
+from replay import Recorder, add_arguments, new_seed
+from scenes import REDRAW_EVENTS
+from startup import add_startup_arguments, startup
+from tetris_engine import (BLACK, TICKS_PER_SECOND, NONE, LEFT, RIGHT, DOWN, ROTATE,
+                           TetrisEngine, convert_shape_format)
+from tetris_shapes import TEMPLATE_OFFSET_X, TEMPLATE_OFFSET_Y
+from text_cache import get_font, render_text
 
-# Initialize Pygame
-pygame.init()
+# Initialize only the pygame subsystems the game uses
+startup.init()
 
 # Screen dimensions
 WIDTH, HEIGHT = 300, 600
@@ -12,332 +24,138 @@ PLAY_WIDTH = 10 * BLOCK_SIZE  # 10 blocks wide
 PLAY_HEIGHT = 20 * BLOCK_SIZE  # 20 blocks high
 
 # Set up the display
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption('Tetris')
+with startup.phase('display'):
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption('Tetris')
 
 # Define colors
-BLACK = (0, 0, 0)
 GRAY = (128, 128, 128)
-COLORS = [
-    (0, 255, 255),  # Cyan
-    (0, 0, 255),    # Blue
-    (255, 165, 0),  # Orange
-    (255, 255, 0),  # Yellow
-    (0, 255, 0),    # Green
-    (128, 0, 128),  # Purple
-    (255, 0, 0),    # Red
-]
-
-# Define the shapes
-SHAPES = [
-    [['.....',
-      '.....',
-      '..OO.',
-      '.OO..',
-      '.....'],
-     ['.....',
-      '..O..',
-      '..OO.',
-      '...O.',
-      '.....']],
-    [['.....',
-      '.....',
-      '.OO..',
-      '..OO.',
-      '.....'],
-     ['.....',
-      '..O..',
-      '.OO..',
-      '.O...',
-      '.....']],
-    [['.....',
-      '...O.',
-      '.OOO.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..OO.',
-      '..O..',
-      '..O..',
-      '.....'],
-     ['.....',
-      '.....',
-      '.OOO.',
-      '.O...',
-      '.....'],
-     ['.....',
-      '..O..',
-      '..O..',
-      '.OO..',
-      '.....']],
-    [['.....',
-      '.O...',
-      '.OOO.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..OO.',
-      '..O..',
-      '..O..',
-      '.....'],
-     ['.....',
-      '.....',
-      '.OOO.',
-      '...O.',
-      '.....'],
-     ['.....',
-      '..O..',
-      '..O..',
-      '.OO..',
-      '.....']],
-    [['.....',
-      '..O..',
-      '.OOO.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..O..',
-      '..OO.',
-      '..O..',
-      '.....'],
-     ['.....',
-      '.....',
-      '.OOO.',
-      '..O..',
-      '.....'],
-     ['.....',
-      '..O..',
-      '.OO..',
-      '..O..',
-      '.....']],
-    [['.....',
-      '.....',
-      '.OOO.',
-      '..O..',
-      '.....'],
-     ['.....',
-      '..O..',
-      '..OO.',
-      '..O..',
-      '.....'],
-     ['.....',
-      '..O..',
-      '.OOO.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..O..',
-      '.OO..',
-      '..O..',
-      '.....']],
-    [['.....',
-      '.....',
-      '.OOOO',
-      '.....',
-      '.....'],
-     ['..O..',
-      '..O..',
-      '..O..',
-      '..O..',
-      '.....']]
-]
-
-class Piece:
-    def __init__(self, x, y, shape):
-        self.x = x
-        self.y = y
-        self.shape = shape
-        self.color = random.choice(COLORS)
-        self.rotation = 0
-
-def create_grid(locked_positions={}):
-    grid = [[BLACK for _ in range(10)] for _ in range(20)]
 
-    for y in range(len(grid)):
-        for x in range(len(grid[y])):
-            if (x, y) in locked_positions:
-                grid[y][x] = locked_positions[(x, y)]
-    return grid
-
-def convert_shape_format(piece):
-    positions = []
-    shape = piece.shape[piece.rotation % len(piece.shape)]
-
-    for i, line in enumerate(shape):
-        row = list(line)
-        for j, column in enumerate(row):
-            if column == 'O':
-                positions.append((piece.x + j - 2, piece.y + i - 4))
-    return positions
-
-def valid_space(piece, grid):
-    accepted_positions = [[(x, y) for x in range(10) if grid[y][x] == BLACK] for y in range(20)]
-    accepted_positions = [x for sub in accepted_positions for x in sub]
-
-    formatted = convert_shape_format(piece)
-    for pos in formatted:
-        if pos not in accepted_positions:
-            if pos[1] > -1:
-                return False
-    return True
-
-def check_lost(positions):
-    for pos in positions:
-        x, y = pos
-        if y < 1:
-            return True
-    return False
-
-def get_shape():
-    return Piece(5, 0, random.choice(SHAPES))
+# Keys mapped to engine actions
+KEY_ACTIONS = {
+    pygame.K_LEFT: LEFT,
+    pygame.K_RIGHT: RIGHT,
+    pygame.K_DOWN: DOWN,
+    pygame.K_UP: ROTATE,
+}
+MAX_FPS = 60  # Render cap; game logic always runs at TICKS_PER_SECOND
+PARTICLES_PER_CELL = 6  # Row-clear effect
 
 def draw_text_middle(text, size, color, surface):
-    font = pygame.font.SysFont('Calibri', size, bold=True)
-    label = font.render(text, True, color)
+    font = get_font('Calibri', size, bold=True)
+    label = render_text(font, text, color)
     surface.blit(label, (WIDTH / 2 - label.get_width() / 2, HEIGHT / 2 - label.get_height() / 2))
 
 def draw_grid(surface, grid):
     for y in range(len(grid)):
         pygame.draw.line(surface, GRAY, (0, y * BLOCK_SIZE), (PLAY_WIDTH, y * BLOCK_SIZE))
-        for x in range(len(grid[y])):
-            pygame.draw.line(surface, GRAY, (x * BLOCK_SIZE, 0), (x * BLOCK_SIZE, PLAY_HEIGHT))
-
-def clear_rows(grid, locked):
-    cleared = 0
-    for y in range(len(grid)-1, -1, -1):
-        row = grid[y]
-        if BLACK not in row:
-            cleared += 1
-            del_row = y
-            for x in range(len(row)):
-                try:
-                    del locked[(x, y)]
-                except:
-                    continue
-
-    if cleared > 0:
-        for key in sorted(list(locked), key=lambda x: x[1])[::-1]:
-            x, y = key
-            if y < del_row:
-                new_key = (x, y + cleared)
-                locked[new_key] = locked.pop(key)
-    return cleared
+    for x in range(len(grid[0])):
+        pygame.draw.line(surface, GRAY, (x * BLOCK_SIZE, 0), (x * BLOCK_SIZE, PLAY_HEIGHT))
 
 def draw_next_shape(shape, surface):
-    font = pygame.font.SysFont('Calibri', 24)
-    label = font.render('Next Shape:', True, (255, 255, 255))
+    font = get_font('Calibri', 24)
+    label = render_text(font, 'Next Shape:', (255, 255, 255))
 
     start_x = PLAY_WIDTH + 10
     start_y = 60
-    shape_format = shape.shape[shape.rotation % len(shape.shape)]
-
-    for i, line in enumerate(shape_format):
-        row = list(line)
-        for j, column in enumerate(row):
-            if column == 'O':
-                pygame.draw.rect(surface, shape.color, (start_x + j * BLOCK_SIZE, start_y + i * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 0)
+    for dx, dy in shape.state().cells:
+        j = dx + TEMPLATE_OFFSET_X
+        i = dy + TEMPLATE_OFFSET_Y
+        pygame.draw.rect(surface, shape.color, (start_x + j * BLOCK_SIZE, start_y + i * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 0)
 
     surface.blit(label, (start_x, 30))
 
-def main():
-    locked_positions = {}
-    grid = create_grid(locked_positions)
-
-    change_piece = False
+def main(dirty_rects=True, max_fps=MAX_FPS, seed=None, recorder=None, inputs=None, speed=1, frame_stats=False):
+    # The engine owns the rules; this loop only feeds it ticks and input and draws it.
+    # With `inputs` (a replay) actions come from the recording instead of the keyboard.
+    engine = TetrisEngine(seed)
+    renderer = DirtyRenderer(screen) if dirty_rects else None
+    particles = ParticlePool()
+    play_area = pygame.Rect(0, 0, PLAY_WIDTH, PLAY_HEIGHT)
+    actions = deque()
+    scheduler = FrameScheduler(TICKS_PER_SECOND * speed, max_fps)
     run = True
-    current_piece = get_shape()
-    next_piece = get_shape()
-    clock = pygame.time.Clock()
-    fall_time = 0
-    fall_speed = 0.5
-    level_time = 0
-    score = 0
-
-    font = pygame.font.SysFont('Calibri', 24)
+
     while run:
-        grid = create_grid(locked_positions)
-        fall_time += clock.get_rawtime()
-        level_time += clock.get_rawtime()
-        clock.tick()
-
-        # Increase speed every 60 seconds
-        if level_time / 1000 > 60:
-            level_time = 0
-            if fall_speed > 0.1:
-                fall_speed -= 0.005
-
-        # Piece falls
-        if fall_time / 1000 > fall_speed:
-            fall_time = 0
-            current_piece.y += 1
-            if not(valid_space(current_piece, grid)) and current_piece.y > 0:
-                current_piece.y -= 1
-                change_piece = True
-
-        # Event handling
-        for event in pygame.event.get():
+        # Sleeps until a key arrives or the next tick is due
+        for event in scheduler.poll():
             if event.type == pygame.QUIT:
                 run = False
                 pygame.display.quit()
                 sys.exit()
 
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_LEFT:
-                    current_piece.x -= 1
-                    if not(valid_space(current_piece, grid)):
-                        current_piece.x += 1
-                elif event.key == pygame.K_RIGHT:
-                    current_piece.x += 1
-                    if not(valid_space(current_piece, grid)):
-                        current_piece.x -= 1
-                elif event.key == pygame.K_DOWN:
-                    current_piece.y += 1
-                    if not(valid_space(current_piece, grid)):
-                        current_piece.y -= 1
-                elif event.key == pygame.K_UP:
-                    current_piece.rotation += 1
-                    if not(valid_space(current_piece, grid)):
-                        current_piece.rotation -= 1
-
-        shape_pos = convert_shape_format(current_piece)
-
-        # Add piece to the grid
-        for pos in shape_pos:
-            x, y = pos
-            if y > -1:
-                grid[y][x] = current_piece.color
-
-        # Piece hit the ground
-        if change_piece:
-            for pos in shape_pos:
-                p = (pos[0], pos[1])
-                locked_positions[p] = current_piece.color
-            current_piece = next_piece
-            next_piece = get_shape()
-            change_piece = False
-            score += clear_rows(grid, locked_positions) * 10
-
-        draw_window(screen, grid, score)
-        draw_next_shape(next_piece, screen)
-        pygame.display.update()
+            if event.type in REDRAW_EVENTS:
+                # The window lost its contents; dirty rects alone won't restore them
+                if renderer:
+                    renderer.invalidate()
+                scheduler.request_render()
+
+            if event.type == pygame.KEYDOWN and event.key in KEY_ACTIONS:
+                actions.append(KEY_ACTIONS[event.key])
+                scheduler.request_render()
+
+        # Fixed-timestep logic, one queued key per tick
+        for _ in range(scheduler.updates()):
+            if engine.lost:
+                break
+            if inputs is not None:
+                action = next(inputs, None)
+                if action is None:
+                    # Recording finished mid-game
+                    return engine
+            else:
+                action = actions.popleft() if actions else NONE
+            if recorder:
+                recorder.record(action)
+            particles.update()
+            if engine.step(action):
+                burst_rows(particles, engine.board.cleared)
+            scheduler.request_render()
+
+        if scheduler.should_render():
+            if renderer:
+                # Only push the rectangles that changed since the last frame
+                dirty = renderer.draw(engine.board.grid, engine.score, engine.current_piece, engine.next_piece)
+                particle_rect = particles.draw(screen, clip=play_area)
+                if particle_rect:
+                    # Cells under the particles are repainted next frame
+                    renderer.damage(particle_rect)
+                    dirty.append(particle_rect)
+                if dirty:
+                    pygame.display.update(dirty)
+            else:
+                draw_window(screen, engine.board.grid, engine.score, engine.current_piece)
+                draw_next_shape(engine.next_piece, screen)
+                particles.draw(screen, clip=play_area)
+                pygame.display.update()
+            scheduler.rendered()
 
         # Check if game is over
-        if check_lost(locked_positions):
+        if engine.lost:
             draw_text_middle("GAME OVER", 40, (255, 255, 255), screen)
             pygame.display.update()
-            pygame.time.delay(2000)
+            if frame_stats:
+                print(scheduler.report())
+            pygame.time.delay(int(2000 / speed))
             run = False
+    return engine
+
+def burst_rows(particles, cleared):
+    # Each block of a cleared row bursts in its own color
+    for y, colors in cleared:
+        for x, color in enumerate(colors):
+            particles.burst((x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), PARTICLES_PER_CELL, color)
 
-def draw_window(surface, grid, score=0):
+def draw_window(surface, grid, score=0, piece=None):
     surface.fill(BLACK)
     # Tetris Title
-    font = pygame.font.SysFont('Calibri', 60)
-    label = font.render('Tetris', True, (255, 255, 255))
+    font = get_font('Calibri', 60)
+    label = render_text(font, 'Tetris', (255, 255, 255))
     surface.blit(label, (WIDTH / 2 - label.get_width() / 2, 30))
 
     # Current Score
-    font = pygame.font.SysFont('Calibri', 24)
-    label = font.render(f'Score: {score}', True, (255, 255, 255))
+    font = get_font('Calibri', 24)
+    label = render_text(font, f'Score: {score}', (255, 255, 255))
     surface.blit(label, (PLAY_WIDTH + 10, 200))
 
     # Draw grid
@@ -345,23 +163,162 @@ def draw_window(surface, grid, score=0):
         for x in range(len(grid[y])):
             pygame.draw.rect(surface, grid[y][x], (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 0)
 
+    # Falling piece is drawn over the locked cells instead of copied into the grid
+    if piece is not None:
+        for x, y in convert_shape_format(piece):
+            if y > -1:
+                pygame.draw.rect(surface, piece.color, (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 0)
+
     # Grid lines
     draw_grid(surface, grid)
 
-def main_menu():
+class DirtyRenderer:
+    # Draws the same picture as draw_window + draw_next_shape, but keeps the
+    # static parts pre-rendered and only repaints cells and labels that changed.
+    # draw() returns the dirty rectangles for pygame.display.update.
+    def __init__(self, surface):
+        self.surface = surface
+        self.cells = [[None] * 10 for _ in range(20)]
+        self.score = None
+        self.score_rect = None
+        self.next_key = None
+        self.full_redraw = True
+
+        self.font = get_font('Calibri', 24)
+        self.title = render_text(get_font('Calibri', 60), 'Tetris', (255, 255, 255))
+        self.next_label = render_text(self.font, 'Next Shape:', (255, 255, 255))
+
+        # Static background: black fill, title and grid lines, behind everything else
+        self.background = pygame.Surface(surface.get_size())
+        self.background.fill(BLACK)
+        self.background.blit(self.title, (WIDTH / 2 - self.title.get_width() / 2, 30))
+        draw_grid(self.background, self.cells)
+
+        # Grid-line overlay, drawn once and blitted over repainted cells
+        self.grid_lines = pygame.Surface((PLAY_WIDTH, PLAY_HEIGHT))
+        self.grid_lines.fill(BLACK)
+        draw_grid(self.grid_lines, self.cells)
+        self.grid_lines.set_colorkey(BLACK)
+
+        # Templates never use their bottom row, so the preview stays clear of the score
+        self.preview_rect = pygame.Rect(PLAY_WIDTH + 10, 60, 5 * BLOCK_SIZE, 4 * BLOCK_SIZE)
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def damage(self, rect):
+        # Something else drew over `rect` in the play area; repaint the cells under it
+        x0 = max(rect.left // BLOCK_SIZE, 0)
+        x1 = min((rect.right - 1) // BLOCK_SIZE, 9)
+        for y in range(max(rect.top // BLOCK_SIZE, 0), min((rect.bottom - 1) // BLOCK_SIZE, 19) + 1):
+            self.cells[y][x0:x1 + 1] = [None] * (x1 + 1 - x0)
+
+    def draw(self, grid, score, piece, next_piece):
+        surface = self.surface
+        dirty = []
+
+        if self.full_redraw:
+            surface.blit(self.background, (0, 0))
+            surface.blit(self.next_label, (PLAY_WIDTH + 10, 30))
+            self.cells = [[None] * 10 for _ in range(20)]
+            self.score = None
+            self.next_key = None
+
+        # Falling piece is overlaid on the locked cells
+        overlay = {}
+        if piece is not None:
+            for x, y in convert_shape_format(piece):
+                if y > -1:
+                    overlay[(x, y)] = piece.color
+
+        for y, row in enumerate(grid):
+            drawn = self.cells[y]
+            for x, color in enumerate(row):
+                if overlay:
+                    color = overlay.get((x, y), color)
+                if drawn[x] != color:
+                    drawn[x] = color
+                    rect = pygame.Rect(x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+                    surface.fill(color, rect)
+                    surface.blit(self.grid_lines, rect, rect)
+                    dirty.append(rect)
+
+        if score != self.score:
+            self.score = score
+            if self.score_rect:
+                surface.blit(self.background, self.score_rect, self.score_rect)
+                dirty.append(self.score_rect)
+            label = render_text(self.font, f'Score: {score}', (255, 255, 255))
+            self.score_rect = surface.blit(label, (PLAY_WIDTH + 10, 200))
+            dirty.append(self.score_rect)
+
+        next_key = (next_piece.shape.index, next_piece.rotation, next_piece.color)
+        if next_key != self.next_key:
+            self.next_key = next_key
+            surface.blit(self.background, self.preview_rect, self.preview_rect)
+            for dx, dy in next_piece.state().cells:
+                j = dx + TEMPLATE_OFFSET_X
+                i = dy + TEMPLATE_OFFSET_Y
+                surface.fill(next_piece.color, (self.preview_rect.x + j * BLOCK_SIZE, self.preview_rect.y + i * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
+            dirty.append(self.preview_rect)
+
+        if self.full_redraw:
+            self.full_redraw = False
+            return [surface.get_rect()]
+        return dirty
+
+def main_menu(seed=None, recorder=None, frame_stats=False):
+    # Every game in a session gets its engine seed from one session RNG
+    session = random.Random(seed)
     run = True
     while run:
         screen.fill(BLACK)
         draw_text_middle('Press Any Key To Play', 30, (255, 255, 255), screen)
         pygame.display.update()
+        startup.first_frame()
 
-        for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                main()
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
-                sys.exit()
+        # Nothing animates on the menu, so block until there is input
+        event = pygame.event.wait()
+        if event.type == pygame.KEYDOWN:
+            main(seed=session.getrandbits(32), recorder=recorder, frame_stats=frame_stats)
+        if event.type == pygame.QUIT:
+            run = False
+            pygame.quit()
+            sys.exit()
+
+def play_replay(replay, speed=0):
+    # Re-run a recorded session; headless at full speed when speed is 0
+    session = random.Random(replay.seed)
+    inputs = replay.inputs()
+    scores = []
+    while True:
+        if speed:
+            engine = main(seed=session.getrandbits(32), inputs=inputs, speed=speed)
+        else:
+            engine = TetrisEngine(session.getrandbits(32))
+            for action in inputs:
+                engine.step(action)
+                if engine.lost:
+                    break
+        if engine.tick == 0:
+            break
+        scores.append(engine.score)
+        if not engine.lost:
+            break
+    return {'games': len(scores), 'scores': scores}
 
 if __name__ == '__main__':
-    main_menu()
+    parser = argparse.ArgumentParser(description='Tetris')
+    parser.add_argument('--frame-stats', action='store_true', help='print frame pacing stats at every game over')
+    add_startup_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    startup.verbose = args.startup_timings
+    seed = args.seed if args.seed is not None else new_seed()
+    recorder = Recorder('tetris', seed) if args.record else None
+    try:
+        main_menu(seed, recorder, args.frame_stats)
+    finally:
+        if recorder:
+            recorder.save(args.record)
+
@@ -0,0 +1,266 @@
+# Auto-player for tetris-claude.py
+#
+# For every new piece the search enumerates each placement the game can
+# actually reach (rotate in place like the UP key, slide left/right, drop
+# like check_collision), scores the resulting board with the usual
+# holes / aggregate height / bumpiness / lines heuristic, and optionally
+# looks one piece ahead using next_piece. Board evaluations are memoized by
+# board state, and the lookahead can be spread over a process pool.
+#
+# Boards are tuples of row bitmasks (bit x = column x occupied). Nothing here
+# imports pygame; the game feeds in its row bitmasks and pieces and gets back actions.
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# Heuristic weights (aggregate height, completed lines, holes, bumpiness)
+HEIGHT_WEIGHT = -0.510066
+LINES_WEIGHT = 0.760666
+HOLES_WEIGHT = -0.35663
+BUMPINESS_WEIGHT = -0.184483
+GAME_OVER_SCORE = -1e9
+
+CACHE_SIZE = 200000
+
+# Actions returned by AutoPlayer.next_action
+ROTATE = 'rotate'
+LEFT = 'left'
+RIGHT = 'right'
+DOWN = 'down'
+
+
+def normalize(shape):
+    return tuple(tuple(1 if cell else 0 for cell in row) for row in shape)
+
+def rotate(shape):
+    # Same clockwise turn as Tetromino.rotate
+    return tuple(zip(*shape[::-1]))
+
+@lru_cache(maxsize=None)
+def rotation_states(shape):
+    # Distinct shapes reachable with 0-3 UP presses from a normalized shape, as
+    # (presses, shape, row masks, lowest filled row of each column)
+    states = []
+    seen = set()
+    current = shape
+    for presses in range(4):
+        if current not in seen:
+            seen.add(current)
+            bottoms = tuple(max(y for y, row in enumerate(current) if row[x]) for x in range(len(current[0])))
+            states.append((presses, current, shape_masks(current), bottoms))
+        current = rotate(current)
+    return tuple(states)
+
+def shape_masks(shape):
+    return tuple(sum(1 << x for x, cell in enumerate(row) if cell) for row in shape)
+
+
+class Searcher:
+    def __init__(self, width=10, height=20, cache_size=CACHE_SIZE):
+        self.width = width
+        self.height = height
+        self.full = (1 << width) - 1
+        self.cache_size = cache_size
+        self.evaluations = {}
+        self.followups = {}
+        self.hits = 0
+        self.misses = 0
+
+    def collides(self, rows, masks, shape_width, x, y):
+        # Mirrors TetrisGame.check_collision
+        if x < 0 or x + shape_width > self.width or y + len(masks) > self.height:
+            return True
+        for dy, bits in enumerate(masks):
+            if rows[y + dy] & (bits << x):
+                return True
+        return False
+
+    def place(self, rows, masks, x, y):
+        # Merge the piece and remove full rows; returns (new rows, lines cleared)
+        rows = list(rows)
+        for dy, bits in enumerate(masks):
+            rows[y + dy] |= bits << x
+        kept = [row for row in rows if row != self.full]
+        lines = self.height - len(kept)
+        return (0,) * lines + tuple(kept), lines
+
+    def surface(self, rows):
+        # Index of the first filled row in each column (height if empty)
+        tops = [self.height] * self.width
+        seen = 0
+        for y, row in enumerate(rows):
+            new = row & ~seen
+            while new:
+                low = new & -new
+                tops[low.bit_length() - 1] = y
+                new ^= low
+            seen |= row
+            if seen == self.full:
+                break
+        return tops
+
+    def placements(self, rows, shape, x0, y0):
+        # Yields (presses, x, landing y, masks) for every reachable placement
+        tops = self.surface(rows)
+        for presses, state, masks, bottoms in rotation_states(shape):
+            shape_width = len(state[0])
+            if self.collides(rows, masks, shape_width, x0, y0):
+                continue
+            xs = [x0]
+            for step in (-1, 1):
+                x = x0 + step
+                while not self.collides(rows, masks, shape_width, x, y0):
+                    xs.append(x)
+                    x += step
+            for x in xs:
+                # Drop straight onto the column heightmap
+                y = min(tops[x + c] - 1 - bottom for c, bottom in enumerate(bottoms))
+                if y < y0:
+                    # Piece is already under an overhang; step down instead
+                    y = y0
+                    while not self.collides(rows, masks, shape_width, x, y + 1):
+                        y += 1
+                yield presses, x, y, masks
+
+    def _remember(self, cache, key, value):
+        if len(cache) >= self.cache_size:
+            cache.clear()
+        cache[key] = value
+
+    def evaluate(self, rows):
+        score = self.evaluations.get(rows)
+        if score is not None:
+            self.hits += 1
+            return score
+        self.misses += 1
+
+        if rows[0]:
+            # TetrisGame.game_over: anything left in the top row ends the game
+            score = GAME_OVER_SCORE
+        else:
+            tops = self.surface(rows)
+            aggregate = self.height * self.width - sum(tops)
+            # Every empty cell under a column's top block is a hole
+            holes = aggregate - sum(bin(row).count('1') for row in rows if row)
+            bumpiness = sum(abs(a - b) for a, b in zip(tops, tops[1:]))
+            score = (HEIGHT_WEIGHT * aggregate + HOLES_WEIGHT * holes +
+                     BUMPINESS_WEIGHT * bumpiness)
+        self._remember(self.evaluations, rows, score)
+        return score
+
+    def spawn_x(self, shape):
+        # Where Tetromino.__init__ puts a new piece
+        return self.width // 2 - len(shape[0]) // 2
+
+    def best_followup(self, rows, shape):
+        # Best score reachable by placing `shape` from its spawn position
+        key = (rows, shape)
+        score = self.followups.get(key)
+        if score is not None:
+            self.hits += 1
+            return score
+        self.misses += 1
+
+        score = GAME_OVER_SCORE
+        for presses, x, y, masks in self.placements(rows, shape, self.spawn_x(shape), 0):
+            after, lines = self.place(rows, masks, x, y)
+            score = max(score, LINES_WEIGHT * lines + self.evaluate(after))
+        self._remember(self.followups, key, score)
+        return score
+
+
+# Per-process searcher so pool workers keep their caches between calls
+_worker_searcher = None
+
+def _followup_job(args):
+    global _worker_searcher
+    width, height, rows, shape = args
+    if _worker_searcher is None or (_worker_searcher.width, _worker_searcher.height) != (width, height):
+        _worker_searcher = Searcher(width, height)
+    return _worker_searcher.best_followup(rows, shape)
+
+
+class AutoPlayer:
+    def __init__(self, width=10, height=20, lookahead=True, workers=0, searcher=None, pool=None):
+        # Players can share a searcher (and its caches), e.g. every board in an arena,
+        # and a worker pool; a shared pool is left to its owner to shut down
+        self.searcher = searcher or Searcher(width, height)
+        self.lookahead = lookahead
+        self.workers = workers
+        self.pool = pool
+        self.owns_pool = pool is None
+        self.plan_for = None
+        self.target = None
+        self.last_state = None
+
+    def close(self):
+        if self.pool is not None and self.owns_pool:
+            self.pool.shutdown()
+        self.pool = None
+
+    def best_placement(self, rows, shape, x, y, next_shape=None):
+        # Returns (presses, x, shape after the presses) or None if nothing fits
+        shape = normalize(shape)
+        candidates = []
+        for presses, px, py, masks in self.searcher.placements(rows, shape, x, y):
+            after, lines = self.searcher.place(rows, masks, px, py)
+            candidates.append((presses, px, after, lines))
+        if not candidates:
+            return None
+
+        if self.lookahead and next_shape is not None:
+            next_shape = normalize(next_shape)
+            jobs = [(self.searcher.width, self.searcher.height, after, next_shape)
+                    for _, _, after, _ in candidates]
+            if self.workers > 1:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(self.workers)
+                chunk = max(1, len(jobs) // (self.workers * 4))
+                futures = list(self.pool.map(_followup_job, jobs, chunksize=chunk))
+            else:
+                futures = [self.searcher.best_followup(after, next_shape) for _, _, after, _ in candidates]
+            scores = [LINES_WEIGHT * lines + followup
+                      for (_, _, _, lines), followup in zip(candidates, futures)]
+        else:
+            scores = [LINES_WEIGHT * lines + self.searcher.evaluate(after)
+                      for _, _, after, lines in candidates]
+
+        best = max(range(len(candidates)), key=scores.__getitem__)
+        presses, px, _, _ = candidates[best]
+        target_shape = shape
+        for _ in range(presses):
+            target_shape = rotate(target_shape)
+        return presses, px, target_shape
+
+    def next_action(self, rows, piece, next_piece, piece_id):
+        # One action per game tick; a new plan is made whenever piece_id changes
+        if piece_id != self.plan_for:
+            self.plan_for = piece_id
+            self.last_state = None
+            self.target = self.best_placement(tuple(rows), piece.shape, piece.x, piece.y, next_piece.shape)
+        if self.target is None:
+            return DOWN
+
+        _, target_x, target_shape = self.target
+        shape = normalize(piece.shape)
+        state = (shape, piece.x, piece.y)
+        stuck = state == self.last_state
+        self.last_state = state
+        if stuck:
+            # The last move was blocked (the piece fell under the plan); just drop
+            self.target = None
+            return DOWN
+        if shape != target_shape:
+            return ROTATE
+        if piece.x > target_x:
+            return LEFT
+        if piece.x < target_x:
+            return RIGHT
+        return DOWN
+
+    def stats(self):
+        return {
+            'cache_hits': self.searcher.hits,
+            'cache_misses': self.searcher.misses,
+            'evaluations_cached': len(self.searcher.evaluations),
+        }
@@ -0,0 +1,97 @@
+# Bitboard playfield for tetris.py
+#
+# Every row of the board is a single int. Column x lives in bit (x + WALL);
+# the bits to the left of the playfield and every bit to the right of it are
+# permanently set, so "piece is off the board" and "piece overlaps a block"
+# are the same AND test.
+
+from tetris_shapes import TEMPLATE_OFFSET_X
+
+COLS = 10
+ROWS = 20
+WALL = 4
+
+EMPTY_ROW = ((1 << WALL) - 1) | (-1 << (WALL + COLS))
+FULL_ROW = -1
+# Rows above the visible board are open, rows below it are solid
+ABOVE_ROW = EMPTY_ROW
+FLOOR_ROW = FULL_ROW
+
+
+class Board:
+    def __init__(self, empty_color, cols=COLS, rows=ROWS):
+        self.cols = cols
+        self.height = rows
+        self.empty_color = empty_color
+        self.rows = [EMPTY_ROW] * rows
+        # Colors are only touched on lock and clear, never per frame
+        self.grid = [[empty_color for _ in range(cols)] for _ in range(rows)]
+        # Blocks per row, kept up to date on lock, and rows that filled up
+        self.fill = [0] * rows
+        self.completed = []
+        # (row, colors) of the rows the last clear removed, for effects
+        self.cleared = []
+
+    def _row(self, y):
+        if y < 0:
+            return ABOVE_ROW
+        if y >= self.height:
+            return FLOOR_ROW
+        return self.rows[y]
+
+    def collides(self, state, x, y):
+        shift = x - TEMPLATE_OFFSET_X + WALL
+        if shift < 0:
+            return True
+        for dy, bits in state.mask:
+            if self._row(y + dy) & (bits << shift):
+                return True
+        return False
+
+    def lock(self, state, x, y, color):
+        shift = x - TEMPLATE_OFFSET_X + WALL
+        for dy, bits in state.mask:
+            row = y + dy
+            if 0 <= row < self.height:
+                added = (bits << shift) & ~self.rows[row]
+                self.rows[row] |= added
+                # Only rows this piece touched can have become full
+                self.fill[row] += bin(added).count('1')
+                if self.fill[row] == self.cols:
+                    self.completed.append(row)
+        for dx, dy in state.cells:
+            if 0 <= y + dy < self.height:
+                self.grid[y + dy][x + dx] = color
+
+    def place(self, x, y, color):
+        # One block, for cells a line clear drops in from above the board
+        self.rows[y] |= 1 << (x + WALL)
+        self.fill[y] += 1
+        self.grid[y][x] = color
+
+    def full_rows(self):
+        return sorted(self.completed)
+
+    def clear_full_rows(self):
+        full = self.full_rows()
+        self.cleared = []
+        if not full:
+            return 0
+        self.completed = []
+
+        # Drop full rows bottom-up so indices stay valid, then recycle
+        # their color rows as the new empty rows at the top
+        recycled = []
+        for y in reversed(full):
+            del self.rows[y]
+            del self.fill[y]
+            recycled.append(self.grid.pop(y))
+            self.cleared.append((y, recycled[-1][:]))
+        for row in recycled:
+            row[:] = [self.empty_color] * self.cols
+
+        cleared = len(full)
+        self.rows[:0] = [EMPTY_ROW] * cleared
+        self.fill[:0] = [0] * cleared
+        self.grid[:0] = recycled
+        return cleared
@@ -0,0 +1,182 @@
+# Display-free Tetris rules for tetris.py
+#
+# TetrisEngine is a pure state machine: every call to step() is one logical
+# tick, so the same engine drives the interactive game (ticked from the wall
+# clock) and headless simulation (ticked as fast as the CPU allows). Nothing
+# in here imports pygame.
+
+import random
+import sys
+import time
+
+from tetris_board import Board
+from tetris_shapes import SHAPE_TABLE
+
+BLACK = (0, 0, 0)
+COLORS = [
+    (0, 255, 255),  # Cyan
+    (0, 0, 255),    # Blue
+    (255, 165, 0),  # Orange
+    (255, 255, 0),  # Yellow
+    (0, 255, 0),    # Green
+    (128, 0, 128),  # Purple
+    (255, 0, 0),    # Red
+]
+
+# Logical clock
+TICKS_PER_SECOND = 60
+LEVEL_TICKS = 60 * TICKS_PER_SECOND  # Speed up every 60 seconds
+
+# Actions accepted by step()
+NONE = 0
+LEFT = 1
+RIGHT = 2
+DOWN = 3
+ROTATE = 4
+ACTIONS = (NONE, LEFT, RIGHT, DOWN, ROTATE)
+
+
+class Piece:
+    def __init__(self, x, y, shape, color):
+        self.x = x
+        self.y = y
+        self.shape = shape
+        self.color = color
+        self.rotation = 0
+
+    def state(self):
+        rotations = self.shape.rotations
+        return rotations[self.rotation % len(rotations)]
+
+
+def convert_shape_format(piece):
+    return [(piece.x + dx, piece.y + dy) for dx, dy in piece.state().cells]
+
+def valid_space(piece, board):
+    return not board.collides(piece.state(), piece.x, piece.y)
+
+def check_lost(positions):
+    for pos in positions:
+        x, y = pos
+        if y < 1:
+            return True
+    return False
+
+def clear_rows(board):
+    return board.clear_full_rows()
+
+
+class TetrisEngine:
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.board = Board(BLACK)
+        self.current_piece = self.get_shape()
+        self.next_piece = self.get_shape()
+        self.tick = 0
+        self.fall_ticks = 0
+        self.level_ticks = 0
+        self.fall_speed = 0.5
+        self.score = 0
+        self.lines = 0
+        self.pieces = 0
+        self.lost = False
+
+    def get_shape(self):
+        return Piece(5, 0, self.rng.choice(SHAPE_TABLE), self.rng.choice(COLORS))
+
+    def move(self, action):
+        piece = self.current_piece
+        if action == LEFT:
+            piece.x -= 1
+            if not valid_space(piece, self.board):
+                piece.x += 1
+        elif action == RIGHT:
+            piece.x += 1
+            if not valid_space(piece, self.board):
+                piece.x -= 1
+        elif action == DOWN:
+            piece.y += 1
+            if not valid_space(piece, self.board):
+                piece.y -= 1
+        elif action == ROTATE:
+            piece.rotation += 1
+            if not valid_space(piece, self.board):
+                piece.rotation -= 1
+
+    def step(self, action=NONE):
+        # Advance one logical tick; returns the number of rows cleared
+        if self.lost:
+            return 0
+
+        self.tick += 1
+        self.fall_ticks += 1
+        self.level_ticks += 1
+        change_piece = False
+
+        # Increase speed every 60 seconds
+        if self.level_ticks > LEVEL_TICKS:
+            self.level_ticks = 0
+            if self.fall_speed > 0.1:
+                self.fall_speed -= 0.005
+
+        # Piece falls
+        if self.fall_ticks > self.fall_speed * TICKS_PER_SECOND:
+            self.fall_ticks = 0
+            piece = self.current_piece
+            piece.y += 1
+            if not valid_space(piece, self.board) and piece.y > 0:
+                piece.y -= 1
+                change_piece = True
+
+        self.move(action)
+
+        if not change_piece:
+            return 0
+
+        # Piece hit the ground
+        piece = self.current_piece
+        positions = convert_shape_format(piece)
+        self.board.lock(piece.state(), piece.x, piece.y, piece.color)
+        self.current_piece = self.next_piece
+        self.next_piece = self.get_shape()
+        self.pieces += 1
+        cleared = clear_rows(self.board)
+        if cleared:
+            # Game over is judged after the clear: cells in cleared rows are
+            # gone and the rest drop by the number of cleared rows below them.
+            # Cells that locked above the board drop onto it like the rest
+            for x, y in positions:
+                if y < 0 <= y + cleared:
+                    self.board.place(x, y + cleared, piece.color)
+            full = [y for y, _ in self.board.cleared]
+            positions = [(x, y + sum(row > y for row in full)) for x, y in positions if y not in full]
+        self.lost = check_lost(positions)
+        self.lines += cleared
+        self.score += cleared * 10
+        return cleared
+
+
+def random_policy(engine, rng):
+    return rng.choice(ACTIONS)
+
+def simulate(games, seed=0, policy=random_policy, max_ticks=None):
+    # Play whole games headless; returns the finished engines
+    rng = random.Random(seed)
+    finished = []
+    for game in range(games):
+        engine = TetrisEngine(seed + game)
+        while not engine.lost and (max_ticks is None or engine.tick < max_ticks):
+            engine.step(policy(engine, rng))
+        finished.append(engine)
+    return finished
+
+
+if __name__ == '__main__':
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    start = time.perf_counter()
+    results = simulate(games)
+    elapsed = time.perf_counter() - start
+    ticks = sum(engine.tick for engine in results)
+    print(f'{games} games, {ticks} ticks in {elapsed:.2f}s '
+          f'({games / elapsed:.0f} games/s, {ticks / elapsed:.0f} ticks/s)')
@@ -0,0 +1,161 @@
+# Compiled Tetris shape tables shared by tetris.py, its preview and tooling
+#
+# The string templates below are the source of truth. They are parsed once at
+# import into immutable per-piece, per-rotation tables so nothing on the hot
+# path ever looks at a string again.
+
+from collections import namedtuple
+
+# Shape templates: 5x5 grids where 'O' is a block, one template per rotation
+SHAPES = [
+    [['.....',
+      '.....',
+      '..OO.',
+      '.OO..',
+      '.....'],
+     ['.....',
+      '..O..',
+      '..OO.',
+      '...O.',
+      '.....']],
+    [['.....',
+      '.....',
+      '.OO..',
+      '..OO.',
+      '.....'],
+     ['.....',
+      '..O..',
+      '.OO..',
+      '.O...',
+      '.....']],
+    [['.....',
+      '...O.',
+      '.OOO.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..OO.',
+      '..O..',
+      '..O..',
+      '.....'],
+     ['.....',
+      '.....',
+      '.OOO.',
+      '.O...',
+      '.....'],
+     ['.....',
+      '..O..',
+      '..O..',
+      '.OO..',
+      '.....']],
+    [['.....',
+      '.O...',
+      '.OOO.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..OO.',
+      '..O..',
+      '..O..',
+      '.....'],
+     ['.....',
+      '.....',
+      '.OOO.',
+      '...O.',
+      '.....'],
+     ['.....',
+      '..O..',
+      '..O..',
+      '.OO..',
+      '.....']],
+    [['.....',
+      '..O..',
+      '.OOO.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..O..',
+      '..OO.',
+      '..O..',
+      '.....'],
+     ['.....',
+      '.....',
+      '.OOO.',
+      '..O..',
+      '.....'],
+     ['.....',
+      '..O..',
+      '.OO..',
+      '..O..',
+      '.....']],
+    [['.....',
+      '.....',
+      '.OOO.',
+      '..O..',
+      '.....'],
+     ['.....',
+      '..O..',
+      '..OO.',
+      '..O..',
+      '.....'],
+     ['.....',
+      '..O..',
+      '.OOO.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..O..',
+      '.OO..',
+      '..O..',
+      '.....']],
+    [['.....',
+      '.....',
+      '.OOOO',
+      '.....',
+      '.....'],
+     ['..O..',
+      '..O..',
+      '..O..',
+      '..O..',
+      '.....']]
+]
+
+# Template column j, row i lands on board cell (x + j - 2, y + i - 4)
+TEMPLATE_OFFSET_X = 2
+TEMPLATE_OFFSET_Y = 4
+
+# cells:   ((dx, dy), ...) offsets from the piece origin
+# mask:    ((dy, bits), ...) one bitmask per occupied row, bit j = template column j
+# bbox:    (min_dx, min_dy, max_dx, max_dy)
+# skirt:   ((dx, lowest dy), ...) per occupied column, for drop distance
+# heights: height of each occupied column measured from the bbox bottom
+Rotation = namedtuple('Rotation', ['cells', 'mask', 'bbox', 'skirt', 'heights'])
+ShapeInfo = namedtuple('ShapeInfo', ['index', 'templates', 'rotations'])
+
+
+def compile_template(template):
+    cells = []
+    mask = []
+    for i, line in enumerate(template):
+        bits = 0
+        for j, column in enumerate(line):
+            if column == 'O':
+                cells.append((j - TEMPLATE_OFFSET_X, i - TEMPLATE_OFFSET_Y))
+                bits |= 1 << j
+        if bits:
+            mask.append((i - TEMPLATE_OFFSET_Y, bits))
+
+    xs = [dx for dx, _ in cells]
+    ys = [dy for _, dy in cells]
+    bbox = (min(xs), min(ys), max(xs), max(ys))
+    columns = sorted(set(xs))
+    skirt = tuple((dx, max(dy for cx, dy in cells if cx == dx)) for dx in columns)
+    heights = tuple(bbox[3] - min(dy for cx, dy in cells if cx == dx) + 1 for dx in columns)
+    return Rotation(tuple(cells), tuple(mask), bbox, skirt, heights)
+
+
+SHAPE_TABLE = tuple(
+    ShapeInfo(index, tuple(tuple(t) for t in templates),
+              tuple(compile_template(t) for t in templates))
+    for index, templates in enumerate(SHAPES)
+)
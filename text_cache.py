@@ -0,0 +1,93 @@
+# Shared font and text-surface cache for all the games
+#
+# pygame.font.SysFont looks the font file up every time it is called, and
+# Font.render rasterizes the string every time, even when nothing changed.
+# get_font() keeps one Font per (name, size, bold, italic) and render_text()
+# keeps recently rendered surfaces per (font, text, antialias, color) in an
+# LRU. Cached surfaces are shared, so callers must only blit them.
+#
+# Fonts are only opened when first asked for, and the time spent opening
+# them (the first SysFont call also scans the system fonts) is kept in
+# font_ms for the startup report.
+
+import time
+from collections import OrderedDict
+
+import pygame
+
+MAX_SURFACES = 256
+
+
+class TextCache:
+    def __init__(self, max_surfaces=MAX_SURFACES):
+        self.max_surfaces = max_surfaces
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.font_hits = 0
+        self.font_misses = 0
+        self.font_ms = 0.0
+        self.text_hits = 0
+        self.text_misses = 0
+        self.evictions = 0
+
+    def get_font(self, name, size, bold=False, italic=False):
+        key = (name, size, bold, italic)
+        font = self.fonts.get(key)
+        if font is not None:
+            self.font_hits += 1
+            return font
+
+        self.font_misses += 1
+        start = time.perf_counter()
+        if name is None:
+            # pygame's bundled default font, as used by pygame.font.Font(None, size)
+            font = pygame.font.Font(None, size)
+            font.set_bold(bold)
+            font.set_italic(italic)
+        else:
+            font = pygame.font.SysFont(name, size, bold=bold, italic=italic)
+        self.font_ms += (time.perf_counter() - start) * 1000
+        self.fonts[key] = font
+        return font
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, antialias, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.text_hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.text_misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
+
+    def stats(self):
+        return {
+            'fonts': len(self.fonts),
+            'font_hits': self.font_hits,
+            'font_misses': self.font_misses,
+            'font_ms': self.font_ms,
+            'surfaces': len(self.surfaces),
+            'text_hits': self.text_hits,
+            'text_misses': self.text_misses,
+            'evictions': self.evictions,
+        }
+
+
+# One cache shared by everything in the process
+text_cache = TextCache()
+
+def get_font(name, size, bold=False, italic=False):
+    return text_cache.get_font(name, size, bold, italic)
+
+def render_text(font, text, color, antialias=True):
+    return text_cache.render(font, text, color, antialias)